@@ -0,0 +1,215 @@
+"""Load benchmark for the API endpoints against the offline PDFDrive stand-in.
+
+    python bench/benchmark.py --concurrency 1 10 50 --requests 200 --latency 0.1
+
+Starts bench/fake_pdfdrive.py in-process, drives the FastAPI app through
+httpx at each concurrency level and reports throughput, latency percentiles
+and upstream requests per API call. With `--workers N` the app runs as a
+separate multi-worker uvicorn server instead, driven over HTTP. Results are
+also written as JSON so runs can be compared before and after a change.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import count
+from typing import Callable, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench", "results")
+sys.path.insert(0, ROOT_DIR)
+
+from fake_pdfdrive import start_fake_pdfdrive  # noqa: E402
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Scenario:
+    """A named API call; `build(n)` returns (method, path, json body or None) for the n-th request."""
+
+    def __init__(self, name: str, build: Callable[[int], tuple], warm_up: bool = False):
+        self.name = name
+        self.build = build
+        # Send the first request once before timing, e.g. to fill a cache
+        self.warm_up = warm_up
+
+
+def make_scenarios(fake_base_url: str, run_id: int) -> List[Scenario]:
+    # Unique queries and book IDs per run keep earlier runs' caches from skewing cold numbers
+    unique = count()
+
+    def cold_search(n):
+        return "GET", f"/api/search?query=bench {run_id} {next(unique)}&no_cache=true", None
+
+    def lazy_search(n):
+        return "GET", f"/api/search?query=lazy {run_id} {next(unique)}&lazy=true", None
+
+    def cached_search(n):
+        return "GET", f"/api/search?query=cached {run_id}", None
+
+    def download_link(n):
+        book_id = 5000000 + run_id * 100000 + next(unique)
+        return "POST", "/api/get-download-link", {"url": f"{fake_base_url}/bench-book-d{book_id}.html"}
+
+    return [
+        Scenario("search_cold", cold_search),
+        Scenario("search_lazy", lazy_search),
+        Scenario("search_cached", cached_search, warm_up=True),
+        Scenario("get_download_link", download_link),
+    ]
+
+
+async def run_scenario(client, fake, scenario: Scenario, concurrency: int, total: int) -> dict:
+    if scenario.warm_up:
+        method, path, body = scenario.build(0)
+        await client.request(method, path, json=body)
+
+    fake.requests.clear()
+    fake.errors = 0
+    latencies = []
+    failures = 0
+    queue = iter(range(total))
+
+    async def worker():
+        nonlocal failures
+        for n in queue:
+            method, path, body = scenario.build(n)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    upstream = fake.stats_dict()
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": total,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "throughput": round(total / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "upstream_requests": upstream["total"],
+        "upstream_per_call": round(upstream["total"] / total, 2),
+        "upstream_errors": upstream["errors"],
+    }
+
+
+async def start_server(workers: int) -> tuple:
+    """Start `uvicorn main:app` with `workers` processes. Returns (Popen, base URL)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT_DIR, env={**os.environ, "WORKERS": str(workers)})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with {server.returncode}")
+        try:
+            # The stand-in runs on this loop, so don't block it while waiting
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            await asyncio.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Server didn't start within 30s")
+
+
+async def run(args) -> dict:
+    fake, runner = await start_fake_pdfdrive(latency=args.latency, jitter=args.jitter,
+                                             error_rate=args.error_rate, padding=args.padding)
+    # The app reads its configuration at import time, so it is imported only once the stand-in is up
+    os.environ["PDFDRIVE_BASE_URL"] = fake.base_url
+    data_dir = tempfile.mkdtemp()
+    os.environ.setdefault("LINK_CACHE_PATH", os.path.join(data_dir, "bench_link_cache.db"))
+    os.environ.setdefault("SEARCH_CACHE_PATH", os.path.join(data_dir, "bench_search_cache.db"))
+    # Keep per-request logging out of the results table
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import httpx
+
+    server = None
+    if args.workers:
+        server, base_url = await start_server(args.workers)
+        client = httpx.AsyncClient(base_url=base_url, timeout=120,
+                                   limits=httpx.Limits(max_connections=max(args.concurrency)))
+    else:
+        import main
+        await main.app.router.startup()
+        client = httpx.AsyncClient(app=main.app, base_url="http://bench", timeout=120)
+    results = []
+    try:
+        async with client:
+            run_id = int(time.time()) % 10000
+            for scenario in make_scenarios(fake.base_url, run_id):
+                if args.scenario and scenario.name not in args.scenario:
+                    continue
+                for concurrency in args.concurrency:
+                    result = await run_scenario(client, fake, scenario, concurrency, args.requests)
+                    results.append(result)
+                    print(f"{result['scenario']:<18} c={concurrency:<4} {result['throughput']:>8} req/s  "
+                          f"p50 {result['p50_ms']:>7}ms  p95 {result['p95_ms']:>7}ms  p99 {result['p99_ms']:>7}ms  "
+                          f"upstream/call {result['upstream_per_call']:<6} failures {result['failures']}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        else:
+            await main.app.router.shutdown()
+        await runner.cleanup()
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "workers": args.workers,
+        "upstream": {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                     "padding": args.padding},
+        "results": results,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    parser.add_argument("--scenario", nargs="+", help="only run these scenarios")
+    parser.add_argument("--latency", type=float, default=0.1, help="mean upstream seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream 503 responses")
+    parser.add_argument("--padding", type=int, default=60000, help="filler bytes per upstream page")
+    parser.add_argument("--workers", type=int, help="run the app as a uvicorn server with this many worker processes")
+    parser.add_argument("--output", help="JSON results file (default bench/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
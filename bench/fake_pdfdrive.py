@@ -0,0 +1,175 @@
+"""Offline stand-in for PDFDrive, serving fixture pages with injected latency and errors.
+
+Run it standalone and point the API at it:
+
+    python bench/fake_pdfdrive.py --port 8765 --latency 0.2 --error-rate 0.05
+    PDFDRIVE_BASE_URL=http://127.0.0.1:8765 uvicorn main:app
+
+or start it in-process with `start_fake_pdfdrive()` (see bench/benchmark.py).
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+from collections import Counter
+from string import Template
+
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Defaults for the injected upstream behaviour, overridable per run
+FAKE_LATENCY = float(os.environ.get("FAKE_LATENCY", "0.1"))
+FAKE_JITTER = float(os.environ.get("FAKE_JITTER", "0.05"))
+FAKE_ERROR_RATE = float(os.environ.get("FAKE_ERROR_RATE", "0"))
+# Filler bytes added to each page so bodies are about as large as the real ones
+FAKE_PAGE_PADDING = int(os.environ.get("FAKE_PAGE_PADDING", "60000"))
+
+BOOKS_PER_PAGE = 20
+TOTAL_RESULTS = 200
+
+# Not a real JPEG, but a cover proxy only cares about the content type and bytes
+FAKE_COVER = b"\xff\xd8\xff\xe0" + b"\x00" * 2048 + b"\xff\xd9"
+FAKE_PDF = b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n"
+
+
+def load_fixture(name: str) -> Template:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return Template(f.read())
+
+
+def book_hash(book_id: int) -> str:
+    return hashlib.md5(str(book_id).encode()).hexdigest()
+
+
+def first_book_id(query: str, page: int) -> int:
+    """Stable book IDs per query and page so repeated runs see the same pages."""
+    digest = int(hashlib.md5(query.lower().encode()).hexdigest()[:6], 16)
+    return 1000000 + digest * 100 + (page - 1) * BOOKS_PER_PAGE
+
+
+class FakePdfDrive:
+    def __init__(self, latency: float = FAKE_LATENCY, jitter: float = FAKE_JITTER,
+                 error_rate: float = FAKE_ERROR_RATE, padding: int = FAKE_PAGE_PADDING):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.padding = "<!-- " + "x" * max(0, padding) + " -->"
+        self.base_url = ""
+        self.requests = Counter()
+        self.errors = 0
+        self.search_page = load_fixture("search.html")
+        self.search_book = load_fixture("search_book.html")
+        self.book_page = load_fixture("book.html")
+        self.waiting_page = load_fixture("download_waiting.html")
+        self.meta_refresh_page = load_fixture("meta_refresh.html")
+
+    @web.middleware
+    async def upstream_behaviour(self, request: web.Request, handler):
+        if request.path.startswith("/__"):
+            return await handler(request)
+        route = request.match_info.route.name or "other"
+        self.requests[route] += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="Service Unavailable")
+        return await handler(request)
+
+    def html(self, template: Template, **values) -> web.Response:
+        page = template.substitute(base_url=self.base_url, padding=self.padding, **values)
+        return web.Response(text=page, content_type="text/html")
+
+    async def search(self, request: web.Request) -> web.Response:
+        query = request.query.get("q", "")
+        page = int(request.query.get("page", "1"))
+        start = first_book_id(query, page)
+        books = []
+        for book_id in range(start, start + BOOKS_PER_PAGE):
+            slug = f"{query.strip().replace(' ', '-') or 'book'}-volume-{book_id}"
+            books.append(self.search_book.substitute(
+                base_url=self.base_url, book_id=book_id, slug=slug,
+                title=f"{query.title()} Volume {book_id}", pages=100 + book_id % 400))
+        return self.html(self.search_page, query=query, books="\n".join(books),
+                         total=TOTAL_RESULTS, next_page=page + 1)
+
+    async def book(self, request: web.Request) -> web.Response:
+        book_id = int(request.match_info["book_id"])
+        # Even IDs link the PDF directly; odd ones only carry the hash in a script,
+        # so both the regex and the parsing extraction strategies get exercised
+        if book_id % 2 == 0:
+            direct_link = (f'<a class="btn btn-success" href="{self.base_url}/download.pdf'
+                           f'?id={book_id}&h={book_hash(book_id)}&u=cache&ext=pdf">Download</a>')
+            hash_field = ""
+        else:
+            direct_link = ""
+            hash_field = f', hash: "{book_hash(book_id)}"'
+        return self.html(self.book_page, book_id=book_id, title=f"Volume {book_id}",
+                         direct_link=direct_link, hash_field=hash_field)
+
+    async def download_page(self, request: web.Request) -> web.Response:
+        book_id = int(request.match_info["book_id"])
+        template = self.meta_refresh_page if book_id % 3 == 0 else self.waiting_page
+        return self.html(template, book_id=book_id, hash=book_hash(book_id))
+
+    async def download_file(self, request: web.Request) -> web.Response:
+        return web.Response(body=FAKE_PDF, content_type="application/pdf")
+
+    async def cover(self, request: web.Request) -> web.Response:
+        return web.Response(body=FAKE_COVER, content_type="image/jpeg")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats_dict())
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.requests.clear()
+        self.errors = 0
+        return web.json_response({"reset": True})
+
+    def stats_dict(self) -> dict:
+        return {"requests": dict(self.requests), "total": sum(self.requests.values()), "errors": self.errors}
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.upstream_behaviour])
+        app.router.add_get("/search", self.search, name="search")
+        app.router.add_get(r"/{slug:[^/]+}-d{book_id:\d+}.html", self.book, name="book")
+        app.router.add_get(r"/download/{book_id:\d+}", self.download_page, name="download_page")
+        app.router.add_get("/download.pdf", self.download_file, name="download_file")
+        app.router.add_get("/download.php", self.download_file, name="download_file_direct")
+        app.router.add_get(r"/assets/thumbs/{book_id:\d+}.jpg", self.cover, name="cover")
+        app.router.add_get("/__stats", self.stats)
+        app.router.add_post("/__reset", self.reset)
+        return app
+
+
+async def start_fake_pdfdrive(host: str = "127.0.0.1", port: int = 0, **options):
+    """Start the stand-in on the running loop. Returns (FakePdfDrive, AppRunner)."""
+    fake = FakePdfDrive(**options)
+    runner = web.AppRunner(fake.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    fake.base_url = f"http://{host}:{bound_port}"
+    return fake, runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=FAKE_LATENCY, help="mean seconds per response")
+    parser.add_argument("--jitter", type=float, default=FAKE_JITTER, help="+/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=FAKE_ERROR_RATE, help="fraction of 503 responses")
+    parser.add_argument("--padding", type=int, default=FAKE_PAGE_PADDING, help="filler bytes per page")
+    args = parser.parse_args()
+
+    fake = FakePdfDrive(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, padding=args.padding)
+    fake.base_url = f"http://{args.host}:{args.port}"
+    print(f"Fake PDFDrive on {fake.base_url} (set PDFDRIVE_BASE_URL to this)")
+    web.run_app(fake.make_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
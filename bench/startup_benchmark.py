@@ -0,0 +1,205 @@
+"""Cold-start benchmark: import time, time to first response and resident memory.
+
+    python bench/startup_benchmark.py --runs 5
+
+Every measurement uses a fresh Python process, as a serverless cold start
+does. Import time is measured for `import main` alone; time to first
+response from spawning `uvicorn main:app` until a static page and a lazy
+search (answered by the offline PDFDrive stand-in) first respond; resident
+memory is read once each of those responded. Results are also written as
+JSON so runs can be compared before and after a change.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT_DIR, "bench")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+ROUTES = {
+    "static": "/",
+    "api": "/api/search?query=startup&lazy=true",
+}
+
+IMPORT_SCRIPT = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process in MiB, or None where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def app_env(**extra) -> dict:
+    """Environment for a cold app process, with empty caches and indexes of its own."""
+    data_dir = tempfile.mkdtemp(prefix="startup_bench_")
+    env = dict(os.environ)
+    env.update({
+        "LOG_LEVEL": "WARNING",
+        "LINK_CACHE_PATH": os.path.join(data_dir, "link_cache.db"),
+        "BOOK_INDEX_PATH": os.path.join(data_dir, "book_index.db"),
+        "COVER_CACHE_DIR": os.path.join(data_dir, "covers"),
+    })
+    env.update(extra)
+    return env
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def measure_import(env: dict) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: dict, top: int) -> List[dict]:
+    """Modules `import main` spends the most time in, including what they import."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        # A module is listed after everything it imports, so main's direct imports come right before it
+        if depth == 0:
+            if name.strip() == "main":
+                break
+            modules = []
+        elif depth == 1:
+            modules.append({"module": name.strip(), "ms": round(int(cumulative) / 1000, 1)})
+    return sorted(modules, key=lambda module: module["ms"], reverse=True)[:top]
+
+
+def measure_first_response(path: str, env: dict, timeout: float) -> dict:
+    """Spawn a server and poll `path` until it answers; returns seconds to the response and RSS."""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"No response from {path} within {timeout}s")
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with {server.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as response:
+                    status = response.status
+                    response.read()
+                break
+            except urllib.error.HTTPError as e:
+                status = e.code
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        return {"seconds": time.perf_counter() - started, "status": status, "rss_mb": rss_mb(server.pid)}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def run(args) -> dict:
+    fake_port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_pdfdrive.py"), "--port", str(fake_port),
+         "--latency", str(args.latency), "--jitter", "0"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    extra = {"PDFDRIVE_BASE_URL": f"http://127.0.0.1:{fake_port}"}
+    if args.warm_up:
+        extra["WARM_UP"] = "1"
+    try:
+        wait_for_port(fake_port)
+        imports = [measure_import(app_env(**extra)) for _ in range(args.runs)]
+        report = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            "warm_up": args.warm_up,
+            "upstream_latency": args.latency,
+            "import": summarize(imports),
+            "slowest_imports": slowest_imports(app_env(**extra), args.top),
+            "first_response": {},
+        }
+        print(f"{'import main':<22} median {report['import']['median_ms']:>7}ms  min {report['import']['min_ms']:>7}ms")
+
+        for name, path in ROUTES.items():
+            samples = [measure_first_response(path, app_env(**extra), args.timeout) for _ in range(args.runs)]
+            rss = [sample["rss_mb"] for sample in samples if sample["rss_mb"] is not None]
+            result = summarize([sample["seconds"] for sample in samples])
+            result["statuses"] = sorted({sample["status"] for sample in samples})
+            result["rss_mb"] = statistics.median(rss) if rss else None
+            report["first_response"][name] = result
+            print(f"{'first response ' + name:<22} median {result['median_ms']:>7}ms  min {result['min_ms']:>7}ms  "
+                  f"rss {result['rss_mb']}MiB  status {result['statuses']}")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    for module in report["slowest_imports"]:
+        print(f"  {module['module']:<24} {module['ms']:>7}ms")
+    return report
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--warm-up", action="store_true", help="start the app with WARM_UP=1")
+    parser.add_argument("--latency", type=float, default=0.05, help="upstream seconds per response")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for a first response")
+    parser.add_argument("--top", type=int, default=8, help="slowest top-level imports to list")
+    parser.add_argument("--output", help="JSON results file (default bench/results/startup-<timestamp>.json)")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, "startup-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+from cache_backends import SqliteDatabase
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Keep every scraped book in a local full-text index
+BOOK_INDEX = os.environ.get("BOOK_INDEX", "1") == "1"
+BOOK_INDEX_PATH = os.environ.get("BOOK_INDEX_PATH", os.path.join(tempfile.gettempdir(), "ebook_book_index.db"))
+# Seconds after which an indexed query is still answered but refreshed from upstream in the background
+BOOK_INDEX_REFRESH_AGE = float(os.environ.get("BOOK_INDEX_REFRESH_AGE", str(24 * 60 * 60)))
+
+_TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query matching titles that contain every word."""
+    return " ".join(f'"{token}"' for token in _TOKEN_PATTERN.findall(query.lower()))
+
+
+class BookIndex(SqliteDatabase):
+    """SQLite FTS5 index of scraped books, plus the search pages they were scraped from.
+
+    A search page is answered from the index when that page was scraped
+    before, or when enough indexed titles match to fill it.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS books ("
+        "book_id TEXT PRIMARY KEY, "
+        "title TEXT NOT NULL, "
+        "image_url TEXT NOT NULL, "
+        "link TEXT NOT NULL, "
+        "download_link TEXT NOT NULL DEFAULT '', "
+        "updated_at REAL NOT NULL);"
+        # External-content FTS table kept in sync with `books` by triggers
+        "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+        "title, content='books', content_rowid='rowid', tokenize='unicode61');"
+        "CREATE TRIGGER IF NOT EXISTS books_ai AFTER INSERT ON books BEGIN "
+        "INSERT INTO books_fts(rowid, title) VALUES (new.rowid, new.title); END;"
+        "CREATE TRIGGER IF NOT EXISTS books_ad AFTER DELETE ON books BEGIN "
+        "INSERT INTO books_fts(books_fts, rowid, title) VALUES ('delete', old.rowid, old.title); END;"
+        "CREATE TRIGGER IF NOT EXISTS books_au AFTER UPDATE OF title ON books BEGIN "
+        "INSERT INTO books_fts(books_fts, rowid, title) VALUES ('delete', old.rowid, old.title); "
+        "INSERT INTO books_fts(rowid, title) VALUES (new.rowid, new.title); END;"
+        "CREATE TABLE IF NOT EXISTS search_pages ("
+        "query TEXT NOT NULL, "
+        "page INTEGER NOT NULL, "
+        "total INTEGER NOT NULL, "
+        "book_ids TEXT NOT NULL, "
+        "indexed_at REAL NOT NULL, "
+        "PRIMARY KEY (query, page));"
+    )
+
+    def __init__(self, path: str = BOOK_INDEX_PATH, enabled: bool = BOOK_INDEX,
+                 refresh_age: float = BOOK_INDEX_REFRESH_AGE):
+        super().__init__(path)
+        self.enabled = enabled
+        self.refresh_age = refresh_age
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.ingested = 0
+        self.errors = 0
+
+    def _ingest(self, query: str, page: int, total: int, books: List[dict]):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT INTO books (book_id, title, image_url, link, download_link, updated_at) "
+                "VALUES (:book_id, :title, :image_url, :link, :download_link, :updated_at) "
+                "ON CONFLICT(book_id) DO UPDATE SET "
+                "title = excluded.title, image_url = excluded.image_url, link = excluded.link, "
+                # A listing without resolved links doesn't wipe out a link resolved earlier
+                "download_link = CASE WHEN excluded.download_link != '' "
+                "THEN excluded.download_link ELSE books.download_link END, "
+                "updated_at = excluded.updated_at",
+                [{**book, "updated_at": now} for book in books]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO search_pages (query, page, total, book_ids, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (query, page, total, ",".join(book["book_id"] for book in books), now)
+            )
+            conn.commit()
+
+    def _search(self, query: str, page: int, limit: int) -> Optional[Tuple[List[dict], int, bool]]:
+        columns = "b.book_id, b.title, b.image_url, b.link, b.download_link"
+        with self._lock:
+            conn = self._connect()
+            scraped = conn.execute(
+                "SELECT total, book_ids, indexed_at FROM search_pages WHERE query = ? AND page = ?",
+                (query, page)
+            ).fetchone()
+            if scraped is not None:
+                # Same books, in the same order, as when the page was scraped
+                book_ids = [book_id for book_id in scraped[1].split(",") if book_id]
+                rows = conn.execute(
+                    f"SELECT {columns} FROM books b WHERE b.book_id IN ({','.join('?' * len(book_ids))})",
+                    book_ids
+                ).fetchall()
+                by_id = {row[0]: row for row in rows}
+                rows = [by_id[book_id] for book_id in book_ids if book_id in by_id]
+                total = scraped[0]
+                is_stale = time.time() - scraped[2] > self.refresh_age
+            else:
+                match = fts_query(query)
+                if not match:
+                    return None
+                total = conn.execute("SELECT count(*) FROM books_fts WHERE books_fts MATCH ?", (match,)).fetchone()[0]
+                # Only answer pages the index can fill; a short page likely means upstream has more
+                if total < page * limit:
+                    return None
+                rows = conn.execute(
+                    f"SELECT {columns} FROM books_fts JOIN books b ON b.rowid = books_fts.rowid "
+                    "WHERE books_fts MATCH ? ORDER BY bm25(books_fts) LIMIT ? OFFSET ?",
+                    (match, limit, (page - 1) * limit)
+                ).fetchall()
+                # Never scraped as such, so refresh it to learn the real listing
+                is_stale = True
+
+        books = [
+            {"title": row[1], "image_url": row[2], "link": row[3], "download_link": row[4], "book_id": row[0]}
+            for row in rows
+        ]
+        return books, total, is_stale
+
+    def _image_url(self, book_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute("SELECT image_url FROM books WHERE book_id = ?", (book_id,)).fetchone()
+        return row[0] if row else None
+
+    def _stats(self) -> Tuple[int, int]:
+        with self._lock:
+            conn = self._connect()
+            books = conn.execute("SELECT count(*) FROM books").fetchone()[0]
+            pages = conn.execute("SELECT count(*) FROM search_pages").fetchone()[0]
+        return books, pages
+
+    async def ingest(self, query: str, page: int, total: int, books: List[dict]):
+        """Upsert a scraped search page's books. `download_link` is "" for books whose link wasn't resolved."""
+        if not self.enabled or not books:
+            return
+        try:
+            await asyncio.to_thread(self._ingest, query, page, total, books)
+            self.ingested += len(books)
+        except sqlite3.Error as e:
+            logger.warning("Error writing book index: %s", e)
+            self.errors += 1
+
+    async def search(self, query: str, page: int, limit: int) -> Optional[Tuple[List[dict], int, bool]]:
+        """Return (books, total, is_stale) for a page the index can answer, or None."""
+        if not self.enabled:
+            return None
+        try:
+            result = await asyncio.to_thread(self._search, query, page, limit)
+        except sqlite3.Error as e:
+            logger.warning("Error reading book index: %s", e)
+            self.errors += 1
+            return None
+
+        if result is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="book_index", outcome="miss")
+        elif result[2]:
+            self.stale_hits += 1
+            CACHE_LOOKUPS.inc(cache="book_index", outcome="stale")
+        else:
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="book_index", outcome="hit")
+        return result
+
+    async def image_url(self, book_id: str) -> Optional[str]:
+        """Return the upstream cover URL of an indexed book, or None."""
+        if not self.enabled:
+            return None
+        try:
+            return await asyncio.to_thread(self._image_url, book_id)
+        except sqlite3.Error as e:
+            logger.warning("Error reading book index: %s", e)
+            self.errors += 1
+            return None
+
+    def stats(self) -> dict:
+        stats = {
+            "enabled": self.enabled,
+            "path": self.path,
+            "refresh_age": self.refresh_age,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "ingested": self.ingested,
+            "errors": self.errors,
+        }
+        if self.enabled:
+            try:
+                stats["books"], stats["search_pages"] = self._stats()
+            except sqlite3.Error as e:
+                logger.warning("Error reading book index stats: %s", e)
+        return stats
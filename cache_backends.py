@@ -0,0 +1,244 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Last-access times are only rewritten this often, so cache hits rarely write to SQLite
+SQLITE_TOUCH_INTERVAL = 30
+# Expired entries are purged and size limits enforced once every this many writes
+SQLITE_EVICT_EVERY = 20
+
+
+class SqliteDatabase:
+    """Lazily opened SQLite connection in WAL mode, shared by this process's threads under a lock.
+
+    Subclasses set `schema` to the statements creating their tables. WAL lets
+    readers in other processes carry on while one process writes.
+    """
+
+    schema = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Other processes may hold the write lock briefly, so wait for it rather than failing
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class MemoryBackend:
+    """LRU dict private to this process, bounded by entry count and JSON size.
+
+    Values are kept as the objects given, so callers must not mutate them.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (stored_at, expires_at, size, value), least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self.evictions = 0
+        self.errors = 0
+
+    async def get(self, key: str, touch: bool = True) -> Optional[Tuple[float, Any]]:
+        """Return (stored_at, value) for an unexpired entry, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, expires_at, _, value = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        if touch:
+            self._entries.move_to_end(key)
+        return stored_at, value
+
+    async def set(self, key: str, value, ttl: float):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        now = time.time()
+        self._entries[key] = (now, now + ttl, size, value)
+        self._size += size
+
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def purge_expired(self):
+        now = time.time()
+        for key in [key for key, entry in self._entries.items() if entry[1] < now]:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        _, _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+class SqliteBackend(SqliteDatabase):
+    """Table in a SQLite database, shared by every process that opens the same file.
+
+    Values are stored as JSON, so worker processes on one machine can share
+    it without a cache server.
+    """
+
+    name = "sqlite"
+    schema = (
+        "CREATE TABLE IF NOT EXISTS cache_entries ("
+        "key TEXT PRIMARY KEY, "
+        "value TEXT NOT NULL, "
+        "size INTEGER NOT NULL, "
+        "stored_at REAL NOT NULL, "
+        "expires_at REAL NOT NULL, "
+        "last_access REAL NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS cache_entries_last_access ON cache_entries (last_access);"
+    )
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _get(self, key: str, touch: bool) -> Optional[Tuple[float, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, stored_at, expires_at, last_access FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[2] < now:
+                return None
+            if touch and now - row[3] > SQLITE_TOUCH_INTERVAL:
+                conn.execute("UPDATE cache_entries SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+        return row[1], json.loads(row[0])
+
+    def _set(self, key: str, value, ttl: float):
+        encoded = json.dumps(value)
+        if len(encoded) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, stored_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), now, now + ttl, now)
+            )
+            self._writes += 1
+            if self._writes % SQLITE_EVICT_EVERY == 0:
+                conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
+                self._evict(conn)
+            conn.commit()
+
+    def _purge_expired(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (time.time(),))
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        entries, total = conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM cache_entries").fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM cache_entries ORDER BY last_access").fetchall():
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            entries -= 1
+            total -= size
+            self.evictions += 1
+
+    def _stats(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM cache_entries WHERE expires_at >= ?", (time.time(),)
+            ).fetchone()
+
+    async def get(self, key: str, touch: bool = True) -> Optional[Tuple[float, Any]]:
+        """Return (stored_at, value) for an unexpired entry, or None."""
+        try:
+            return await asyncio.to_thread(self._get, key, touch)
+        except sqlite3.Error as e:
+            logger.warning("Error reading %s cache: %s", self.path, e)
+            self.errors += 1
+            return None
+
+    async def set(self, key: str, value, ttl: float):
+        try:
+            await asyncio.to_thread(self._set, key, value, ttl)
+        except sqlite3.Error as e:
+            logger.warning("Error writing %s cache: %s", self.path, e)
+            self.errors += 1
+
+    async def purge_expired(self):
+        try:
+            await asyncio.to_thread(self._purge_expired)
+        except sqlite3.Error as e:
+            logger.warning("Error purging %s cache: %s", self.path, e)
+            self.errors += 1
+
+    def stats(self) -> dict:
+        stats = {
+            "backend": self.name,
+            "path": self.path,
+            "entries": 0,
+            "bytes": 0,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+        try:
+            stats["entries"], stats["bytes"] = self._stats()
+        except sqlite3.Error as e:
+            logger.warning("Error reading %s cache stats: %s", self.path, e)
+        return stats
+
+
+def create_cache_backend(name: str, path: str, max_entries: int, max_bytes: int):
+    """Build the backend called `name`: "memory", or "sqlite" stored at `path`."""
+    if name == "memory":
+        return MemoryBackend(max_entries, max_bytes)
+    if name == "sqlite":
+        return SqliteBackend(path, max_entries, max_bytes)
+    raise ValueError(f"Unknown cache backend {name!r}, expected 'memory' or 'sqlite'")
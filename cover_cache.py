@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+from cache_backends import SqliteDatabase
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Serve book covers through /api/cover/{book_id} instead of linking the upstream images
+COVER_PROXY = os.environ.get("COVER_PROXY", "1") == "1"
+COVER_CACHE_DIR = os.environ.get("COVER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ebook_covers"))
+COVER_CACHE_MAX_BYTES = int(os.environ.get("COVER_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# Larger upstream images aren't cached or served
+COVER_MAX_BYTES = int(os.environ.get("COVER_MAX_BYTES", str(2 * 1024 * 1024)))
+# Comma-separated hosts, besides PDFDRIVE_BASE_URL's, that the cover proxy may fetch a `src` image
+# from when a book isn't in this instance's book index
+COVER_SOURCE_HOSTS = [host.strip().lower() for host in os.environ.get("COVER_SOURCE_HOSTS", "").split(",") if host.strip()]
+# Seconds browsers and CDNs may reuse a cover without revalidating
+COVER_MAX_AGE = int(os.environ.get("COVER_MAX_AGE", str(30 * 24 * 60 * 60)))
+# Last-access times are only rewritten this often, so cache hits rarely write to SQLite
+COVER_TOUCH_INTERVAL = 3600
+
+
+def cover_digest(content: bytes) -> str:
+    """SHA-256 of a cover image, used as its file name and ETag."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class CoverCache(SqliteDatabase):
+    """Size-bounded, content-addressed disk cache of cover images with LRU eviction.
+
+    Images are stored once per SHA-256 digest, which doubles as their ETag;
+    book IDs map to digests, so identical placeholder covers share a file.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS blobs ("
+        "digest TEXT PRIMARY KEY, "
+        "content_type TEXT NOT NULL, "
+        "size INTEGER NOT NULL, "
+        "last_access REAL NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);"
+        "CREATE TABLE IF NOT EXISTS covers ("
+        "book_id TEXT PRIMARY KEY, "
+        "digest TEXT NOT NULL);"
+    )
+
+    def __init__(self, directory: str = COVER_CACHE_DIR, max_bytes: int = COVER_CACHE_MAX_BYTES):
+        super().__init__(os.path.join(directory, "covers.db"))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+        return super()._connect()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _get(self, book_id: str) -> Optional[Tuple[str, str, bytes]]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT b.digest, b.content_type, b.last_access FROM covers c JOIN blobs b ON b.digest = c.digest "
+                "WHERE c.book_id = ?",
+                (book_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, content_type, last_access = row
+            now = time.time()
+            if now - last_access > COVER_TOUCH_INTERVAL:
+                conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (now, digest))
+                conn.commit()
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return digest, content_type, f.read()
+        except FileNotFoundError:
+            return None
+
+    def _set(self, book_id: str, digest: str, content_type: str, content: bytes):
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (digest, content_type, size, last_access) VALUES (?, ?, ?, ?)",
+                (digest, content_type, len(content), time.time())
+            )
+            conn.execute("INSERT OR REPLACE INTO covers (book_id, digest) VALUES (?, ?)", (book_id, digest))
+            conn.commit()
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT coalesce(sum(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, size in conn.execute("SELECT digest, size FROM blobs ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM covers WHERE digest = ?", (digest,))
+            conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        conn.commit()
+
+    async def get(self, book_id: str) -> Optional[Tuple[str, str, bytes]]:
+        """Return (digest, content type, image bytes) for a cached cover, or None."""
+        try:
+            cover = await asyncio.to_thread(self._get, book_id)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Error reading cover cache: %s", e)
+            self.errors += 1
+            return None
+        if cover is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="covers", outcome="miss")
+        else:
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="covers", outcome="hit")
+        return cover
+
+    async def set(self, book_id: str, content_type: str, content: bytes) -> str:
+        """Store a cover and return its digest, which is returned even if storing failed."""
+        digest = cover_digest(content)
+        try:
+            await asyncio.to_thread(self._set, book_id, digest, content_type, content)
+            self.writes += 1
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Error writing cover cache: %s", e)
+            self.errors += 1
+        return digest
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
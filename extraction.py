@@ -0,0 +1,240 @@
+import os
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+import metrics
+from parsing import DETAIL_PAGE_ONLY, parse_html_async
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# Point this at a local stand-in (see bench/fake_pdfdrive.py) to scrape without the live site
+PDFDRIVE_BASE_URL = os.environ.get("PDFDRIVE_BASE_URL", "https://www.pdfdrive.com").rstrip('/')
+CACHE_PARAMS = "&u=cache&ext=pdf"
+
+# Direct PDF download URL, preferably with the trailing cache parameters
+PDF_DOWNLOAD_PATTERN = re.compile(re.escape(PDFDRIVE_BASE_URL) + r'/download\.pdf\?id=(\d+)&h=([a-f0-9]+)(&u=cache&ext=pdf)')
+PDF_DOWNLOAD_PARTIAL_PATTERN = re.compile(re.escape(PDFDRIVE_BASE_URL) + r'/download\.pdf\?id=(\d+)&h=([a-f0-9]+)')
+BOOK_PAGE_ID_PATTERN = re.compile(r'-d(\d+)\.html$')
+DOWNLOAD_ID_PATTERN = re.compile(r'id=(\d+)')
+SCRIPT_DOWNLOAD_URL_PATTERN = re.compile(r'["\']([^"\']*?download[^"\']*?)["\']')
+SCRIPT_HASH_PATTERN = re.compile(r'hash[\s]*:[\s]*[\'"]?([a-f0-9]+)[\'"]?')
+SCRIPT_REDIRECT_PATTERN = re.compile(r'location(?:\.href)?\s*=\s*[\'"]([^\'"]*)[\'"]')
+META_REFRESH_URL_PATTERN = re.compile(r'url=([^;]+)')
+EMBEDDED_ID_PATTERN = re.compile(r'(?:id|bookId)[\s]*:[\s]*[\'"]?(\d+)[\'"]?')
+EMBEDDED_HASH_PATTERN = re.compile(r'(?:hash|h)[\s]*:[\s]*[\'"]?([a-f0-9]+)[\'"]?')
+
+EXTRACTIONS = metrics.Counter("link_extractions_total", "Link extractions by extractor and matching strategy, none for misses",
+                              ("extractor", "strategy"))
+
+
+def absolute_url(href: str) -> str:
+    if href.startswith('/'):
+        return f"{PDFDRIVE_BASE_URL}{href}"
+    return href
+
+
+def with_cache_params(url: str) -> str:
+    """Add the cache parameters PDFDrive expects on direct PDF download links."""
+    if "download.pdf?id=" in url and CACHE_PARAMS not in url:
+        url += CACHE_PARAMS
+    return url
+
+
+def build_pdf_url(book_id: str, hash_val: str) -> str:
+    return f"{PDFDRIVE_BASE_URL}/download.pdf?id={book_id}&h={hash_val}{CACHE_PARAMS}"
+
+
+def extract_book_id(book_url: str) -> str:
+    """Return the PDFDrive book ID from a book page URL, or "" if it has none."""
+    match = BOOK_PAGE_ID_PATTERN.search(book_url)
+    return match.group(1) if match else ""
+
+
+class Strategy:
+    """One way of finding a link in a page.
+
+    `find` receives the raw HTML, the parsed soup (None for text strategies)
+    and the URL of the page, and returns the link or None.
+    """
+
+    def __init__(self, name: str, find: Callable[[str, Optional["BeautifulSoup"], str], Optional[str]],
+                 needs_soup: bool = False):
+        self.name = name
+        self.find = find
+        self.needs_soup = needs_soup
+
+
+class LinkExtractor:
+    """Runs strategies in order and stops at the first hit.
+
+    The page is only parsed once a strategy that needs the soup is reached,
+    so pages matched by a regex strategy are never parsed.
+    """
+
+    def __init__(self, name: str, strategies: List[Strategy]):
+        self.name = name
+        self.strategies = strategies
+        self.hits = Counter()
+        self.misses = 0
+        self.parses = 0
+
+    async def extract(self, html: str, page_url: str) -> Tuple[str, Optional[str]]:
+        """Return (link, strategy name), or ("", None) if no strategy matched."""
+        soup = None
+        for strategy in self.strategies:
+            if strategy.needs_soup and soup is None:
+                soup = await parse_html_async(html, DETAIL_PAGE_ONLY)
+                self.parses += 1
+            link = strategy.find(html, soup, page_url)
+            if link:
+                self.hits[strategy.name] += 1
+                EXTRACTIONS.inc(extractor=self.name, strategy=strategy.name)
+                return link, strategy.name
+        self.misses += 1
+        EXTRACTIONS.inc(extractor=self.name, strategy="none")
+        return "", None
+
+    def stats(self) -> dict:
+        return {
+            "hits": {strategy.name: self.hits[strategy.name] for strategy in self.strategies},
+            "misses": self.misses,
+            "parses": self.parses,
+        }
+
+
+# Text strategies
+
+def find_pdf_url(html, soup, page_url):
+    match = PDF_DOWNLOAD_PATTERN.search(html)
+    if match:
+        return match.group(0)
+    return None
+
+
+def find_partial_pdf_url(html, soup, page_url):
+    match = PDF_DOWNLOAD_PARTIAL_PATTERN.search(html)
+    if match:
+        return with_cache_params(match.group(0))
+    return None
+
+
+def find_embedded_data(html, soup, page_url):
+    book_id_match = EMBEDDED_ID_PATTERN.search(html)
+    hash_match = EMBEDDED_HASH_PATTERN.search(html)
+    if book_id_match and hash_match:
+        return build_pdf_url(book_id_match.group(1), hash_match.group(1))
+    return None
+
+
+# Soup strategies
+
+def find_download_button_link(html, soup, page_url):
+    button = soup.find('a', id='download-button-link')
+    if button and button.get('href'):
+        return with_cache_params(absolute_url(button.get('href')))
+    return None
+
+
+def find_file_buttons(html, soup, page_url):
+    for button in soup.select('a.btn-success, a[href*="download"]'):
+        href = button.get('href')
+        if href and ('download.pdf' in href or 'getfile.php' in href):
+            return with_cache_params(absolute_url(href))
+    return None
+
+
+def find_script_hash(html, soup, page_url):
+    book_id_match = BOOK_PAGE_ID_PATTERN.search(page_url)
+    if not book_id_match:
+        return None
+    for script in soup.find_all('script'):
+        hash_match = SCRIPT_HASH_PATTERN.search(script.string or '')
+        if hash_match:
+            return build_pdf_url(book_id_match.group(1), hash_match.group(1))
+    return None
+
+
+def find_download_page_button(html, soup, page_url):
+    selectors = [
+        'a#download-button',
+        'a#download-button-link',
+        'a.btn-success',
+        'a[href*="download"]',
+        'a.btn-primary'
+    ]
+    for selector in selectors:
+        for button in soup.select(selector):
+            href = button.get('href')
+            if href and (href.startswith('/') or href.startswith('http')):
+                return absolute_url(href)
+    return None
+
+
+def find_script_download_page(html, soup, page_url):
+    for script in soup.find_all('script'):
+        for url in SCRIPT_DOWNLOAD_URL_PATTERN.findall(script.string or ''):
+            if '/download' in url and (url.startswith('/') or url.startswith('http')):
+                return absolute_url(url)
+    return None
+
+
+def find_any_download_button(html, soup, page_url):
+    for selector in ['a.btn-success', 'a.btn-primary', 'a[href*="download.pdf"]']:
+        for button in soup.select(selector):
+            href = button.get('href')
+            if href:
+                return with_cache_params(absolute_url(href))
+    return None
+
+
+def find_meta_refresh(html, soup, page_url):
+    meta_refresh = soup.find('meta', attrs={'http-equiv': 'refresh'})
+    if meta_refresh:
+        url_match = META_REFRESH_URL_PATTERN.search(meta_refresh.get('content', ''))
+        if url_match:
+            return absolute_url(url_match.group(1))
+    return None
+
+
+def find_script_redirect(html, soup, page_url):
+    for script in soup.find_all('script'):
+        script_text = script.string or ''
+        if 'setTimeout' in script_text or 'window.location' in script_text:
+            url_match = SCRIPT_REDIRECT_PATTERN.search(script_text)
+            if url_match:
+                return absolute_url(url_match.group(1))
+    return None
+
+
+# Finds the direct download link on a book page while scraping search results
+book_page_extractor = LinkExtractor("book_page", [
+    Strategy("pdf_url", find_pdf_url),
+    Strategy("partial_pdf_url", find_partial_pdf_url),
+    Strategy("download_button_link", find_download_button_link, needs_soup=True),
+    Strategy("file_buttons", find_file_buttons, needs_soup=True),
+    Strategy("script_hash", find_script_hash, needs_soup=True),
+])
+
+# Finds the link to the download waiting page on a book page
+download_page_extractor = LinkExtractor("download_page", [
+    Strategy("download_page_button", find_download_page_button, needs_soup=True),
+    Strategy("script_download_page", find_script_download_page, needs_soup=True),
+])
+
+# Finds the final download link on the download waiting page
+final_url_extractor = LinkExtractor("final_url", [
+    Strategy("pdf_url", find_pdf_url),
+    Strategy("partial_pdf_url", find_partial_pdf_url),
+    Strategy("download_buttons", find_any_download_button, needs_soup=True),
+    Strategy("meta_refresh", find_meta_refresh, needs_soup=True),
+    Strategy("script_redirect", find_script_redirect, needs_soup=True),
+    Strategy("embedded_data", find_embedded_data),
+])
+
+EXTRACTORS = [book_page_extractor, download_page_extractor, final_url_extractor]
+
+
+def extraction_stats() -> dict:
+    return {extractor.name: extractor.stats() for extractor in EXTRACTORS}
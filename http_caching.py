@@ -0,0 +1,69 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Cache-Control for cacheable API responses: browsers revalidate after API_CACHE_MAX_AGE,
+# shared caches such as a CDN keep them for API_CACHE_S_MAXAGE and may serve them stale
+# for API_CACHE_STALE_WHILE_REVALIDATE more seconds while refetching
+API_CACHE_MAX_AGE = int(os.environ.get("API_CACHE_MAX_AGE", "0"))
+API_CACHE_S_MAXAGE = int(os.environ.get("API_CACHE_S_MAXAGE", "300"))
+API_CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get("API_CACHE_STALE_WHILE_REVALIDATE", "3600"))
+# JSON responses at least this large are gzip-compressed for clients that accept it
+API_GZIP_MIN_BYTES = int(os.environ.get("API_GZIP_MIN_BYTES", "1024"))
+
+API_CACHE_CONTROL = (f"public, max-age={API_CACHE_MAX_AGE}, s-maxage={API_CACHE_S_MAXAGE}, "
+                     f"stale-while-revalidate={API_CACHE_STALE_WHILE_REVALIDATE}")
+NO_STORE = "no-store"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag, using the weak comparison it calls for."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    etag = etag[2:] if etag.startswith("W/") else etag
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """Encodings the client accepts, ignoring any it refused with q=0."""
+    encodings = []
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.append(name.strip().lower())
+    return encodings
+
+
+def dumps(data) -> bytes:
+    """Serialize to JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(request: Request, data, cache_control: str = NO_STORE) -> Response:
+    """JSON response with an ETag of its content, a 304 for a matching If-None-Match on
+    GET requests, and gzip compression of larger bodies."""
+    body = dumps(data)
+    # Weak, since the same content is sent both plain and gzip-compressed
+    etag = f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if request.method in ("GET", "HEAD") and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if len(body) >= API_GZIP_MIN_BYTES and "gzip" in accepted_encodings(request.headers.get("accept-encoding", "")):
+        body = gzip.compress(body, compresslevel=6, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
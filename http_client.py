@@ -0,0 +1,198 @@
+import asyncio
+import codecs
+import os
+import re
+import time
+from typing import TYPE_CHECKING, Optional
+
+from metrics import Histogram
+
+# aiohttp takes a while to import, so it is only loaded with the first upstream request
+if TYPE_CHECKING:
+    import aiohttp
+
+# Connection pool settings for all upstream requests
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", "300"))
+
+# Scan detail pages while they download and stop as soon as a link is found
+STREAM_SCAN = os.environ.get("STREAM_SCAN", "1") == "1"
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", "16384"))
+# Bytes of a streamed body read at most before giving up on the rest of the page
+STREAM_MAX_BYTES = int(os.environ.get("STREAM_MAX_BYTES", str(2 * 1024 * 1024)))
+# Characters carried over between chunks so matches spanning a chunk boundary are found
+STREAM_WINDOW_OVERLAP = 512
+
+_session: Optional["aiohttp.ClientSession"] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Lifetime counters, mostly collected through aiohttp tracing hooks
+_stats = {
+    "requests": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "dns_cache_hits": 0,
+    "dns_cache_misses": 0,
+    "streamed_bytes": 0,
+    "early_terminations": 0,
+    "truncated_bodies": 0,
+}
+
+UPSTREAM_CONNECT_SECONDS = Histogram("upstream_connect_seconds", "Time to open a new upstream connection",
+                                     ("host",), stage="upstream_connect")
+UPSTREAM_TTFB_SECONDS = Histogram("upstream_ttfb_seconds", "Time from sending an upstream request to its response headers",
+                                  ("host",), stage="upstream_ttfb")
+
+
+async def _on_request_start(session, context, params):
+    _stats["requests"] += 1
+    # Same host:port naming as the per-host stats in upstream_health
+    context.host = params.url.host if params.url.is_default_port() else f"{params.url.host}:{params.url.port}"
+    context.started = time.monotonic()
+
+
+async def _on_request_end(session, context, params):
+    UPSTREAM_TTFB_SECONDS.observe(time.monotonic() - context.started, host=context.host)
+
+
+async def _on_connection_create_start(session, context, params):
+    context.connect_started = time.monotonic()
+
+
+async def _on_connection_create_end(session, context, params):
+    _stats["connections_created"] += 1
+    # Connection tracing params don't carry the URL, so the host comes from the request start
+    UPSTREAM_CONNECT_SECONDS.observe(time.monotonic() - context.connect_started, host=context.host)
+
+
+async def _on_connection_reuseconn(session, context, params):
+    _stats["connections_reused"] += 1
+
+
+async def _on_dns_cache_hit(session, context, params):
+    _stats["dns_cache_hits"] += 1
+
+
+async def _on_dns_cache_miss(session, context, params):
+    _stats["dns_cache_misses"] += 1
+
+
+def _create_session() -> "aiohttp.ClientSession":
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+    )
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_dns_cache_hit.append(_on_dns_cache_hit)
+    trace_config.on_dns_cache_miss.append(_on_dns_cache_miss)
+
+    # Per-request timeouts are passed to session.get() by the callers
+    return aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+
+
+def get_http_session() -> "aiohttp.ClientSession":
+    """Return the shared client session, creating it on first use."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # A session is bound to the loop it was created on, so a new loop
+        # (e.g. a fresh serverless invocation) gets a new pool
+        _session = _create_session()
+        _session_loop = loop
+    return _session
+
+
+def client_timeout(total: float) -> "aiohttp.ClientTimeout":
+    """Per-request timeout for `session.get()`."""
+    import aiohttp
+    return aiohttp.ClientTimeout(total=total)
+
+
+async def close_http_client():
+    """Close the shared client session and its pooled connections."""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+async def read_text(response: "aiohttp.ClientResponse", stop_pattern: Optional[re.Pattern] = None) -> str:
+    """Read a response body, stopping early once `stop_pattern` matches.
+
+    With streaming disabled this is just `response.text()`. Otherwise the body
+    is decoded chunk by chunk and `stop_pattern` is searched over a sliding
+    window; on a match, or once STREAM_MAX_BYTES have been read, the connection
+    is closed and the text read so far is returned.
+    """
+    if not STREAM_SCAN:
+        return await response.text()
+
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    parts = []
+    tail = ''
+    bytes_read = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        bytes_read += len(chunk)
+        _stats["streamed_bytes"] += len(chunk)
+        text = decoder.decode(chunk)
+        parts.append(text)
+
+        if stop_pattern is not None:
+            window = tail + text
+            match = stop_pattern.search(window)
+            # A match touching the end of the window may continue in the next chunk
+            if match and match.end() < len(window):
+                _stats["early_terminations"] += 1
+                response.close()
+                return ''.join(parts)
+            tail = window[-STREAM_WINDOW_OVERLAP:]
+
+        if bytes_read >= STREAM_MAX_BYTES:
+            _stats["truncated_bodies"] += 1
+            response.close()
+            return ''.join(parts)
+
+    parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts)
+
+
+def get_pool_stats() -> dict:
+    """Return connection pool settings, current usage and lifetime counters."""
+    stats = {
+        "limit": HTTP_POOL_LIMIT,
+        "limit_per_host": HTTP_POOL_LIMIT_PER_HOST,
+        "keepalive_timeout": HTTP_KEEPALIVE_TIMEOUT,
+        "dns_cache_ttl": HTTP_DNS_CACHE_TTL,
+        "open": _session is not None and not _session.closed,
+        "acquired_connections": 0,
+        "idle_connections": 0,
+    }
+    if stats["open"]:
+        connector = _session.connector
+        # aiohttp doesn't expose pool usage publicly, so read it defensively
+        acquired = getattr(connector, "_acquired", None)
+        idle = getattr(connector, "_conns", None)
+        if acquired is not None:
+            stats["acquired_connections"] = len(acquired)
+        if idle is not None:
+            stats["idle_connections"] = sum(len(conns) for conns in idle.values())
+    stats.update(_stats)
+    return stats
@@ -0,0 +1,89 @@
+import logging
+import os
+import tempfile
+from typing import Optional
+
+from cache_backends import create_cache_backend
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+LINK_CACHE_PATH = os.environ.get("LINK_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ebook_link_cache.db"))
+# Seconds a resolved download URL is reused
+LINK_CACHE_TTL = float(os.environ.get("LINK_CACHE_TTL", str(24 * 60 * 60)))
+# Seconds a failed resolution is remembered before upstream is tried again
+LINK_CACHE_NEGATIVE_TTL = float(os.environ.get("LINK_CACHE_NEGATIVE_TTL", "600"))
+# "sqlite" keeps resolved links in LINK_CACHE_PATH, shared by worker processes and restarts;
+# "memory" keeps them in this process only
+LINK_CACHE_BACKEND = os.environ.get("LINK_CACHE_BACKEND", "sqlite")
+# Least recently used links are evicted beyond this many
+LINK_CACHE_MAX_ENTRIES = int(os.environ.get("LINK_CACHE_MAX_ENTRIES", "100000"))
+LINK_CACHE_MAX_BYTES = int(os.environ.get("LINK_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Ways of resolving a link. Failures are remembered per strategy, since a book page without
+# a direct link can still be resolved through its download waiting page
+BOOK_PAGE = "page"
+DOWNLOAD_CHAIN = "chain"
+
+
+class LinkCache:
+    """Cache mapping book IDs to resolved download URLs, kept in a cache backend.
+
+    A failed resolution is stored as an empty URL under its strategy, so that
+    strategy isn't retried until its (shorter) TTL runs out.
+    """
+
+    def __init__(self, backend: str = LINK_CACHE_BACKEND, path: str = LINK_CACHE_PATH, ttl: float = LINK_CACHE_TTL,
+                 negative_ttl: float = LINK_CACHE_NEGATIVE_TTL, max_entries: int = LINK_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LINK_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.backend = create_cache_backend(backend, path, max_entries, max_bytes)
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    async def get(self, book_id: str, strategy: Optional[str] = None) -> Optional[str]:
+        """Return the cached URL, "" when `strategy` failed for this book recently, or None on a miss."""
+        entry = await self.backend.get(book_id)
+        if entry is None and strategy:
+            entry = await self.backend.get(f"{strategy}:{book_id}")
+        if entry is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="download_links", outcome="miss")
+            return None
+
+        download_url = entry[1]
+        if download_url:
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="download_links", outcome="hit")
+        else:
+            self.negative_hits += 1
+            CACHE_LOOKUPS.inc(cache="download_links", outcome="negative")
+        return download_url
+
+    async def set(self, book_id: str, download_url: str, strategy: str):
+        """Store a resolved URL, or "" to record that `strategy` failed to resolve one."""
+        if download_url:
+            await self.backend.set(book_id, download_url, self.ttl)
+        else:
+            await self.backend.set(f"{strategy}:{book_id}", "", self.negative_ttl)
+        self.writes += 1
+
+    async def purge_expired(self):
+        await self.backend.purge_expired()
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.backend.stats(),
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+        }
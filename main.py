@@ -1,21 +1,100 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from bs4 import BeautifulSoup
-import aiohttp
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response, StreamingResponse
 import asyncio
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 import json
+import logging
 import os
 from pydantic import BaseModel
-import re
 import random
 import string
 import time
+from urllib.parse import quote, urlsplit
+
+from book_index import BookIndex
+from cover_cache import COVER_MAX_AGE, COVER_MAX_BYTES, COVER_PROXY, COVER_SOURCE_HOSTS, CoverCache, cover_digest
+from extraction import DOWNLOAD_ID_PATTERN, PDF_DOWNLOAD_PARTIAL_PATTERN, PDFDRIVE_BASE_URL, book_page_extractor, download_page_extractor, extract_book_id, extraction_stats, final_url_extractor
+from http_caching import API_CACHE_CONTROL, NO_STORE, etag_matches, json_response
+from http_client import client_timeout, close_http_client, get_http_session, get_pool_stats, read_text
+from link_cache import BOOK_PAGE, DOWNLOAD_CHAIN, LinkCache
+from metrics import SERVER_TIMING, Counter, Gauge, Histogram, render_metrics, server_timing_header, start_request_timing
+from parsing import SEARCH_PAGE_ONLY, load_parser, parse_html_async, shutdown_parser_pool
+from prefetch import Prefetcher
+from retry import DOWNLOAD_LINK_DEADLINE, Deadline, RetryPolicy
+from search_cache import CACHE_BACKEND, SearchCache, normalize_search_key
+from singleflight import SingleFlight, single_flight, upstream_flights
+from static_assets import AssetFiles, AssetStore
+from structured_logging import new_request_id, request_id_var, setup_logging, stop_logging
+from upstream_health import UpstreamUnavailable, guarded_get, upstream_health
+
+# Scraping dependencies are imported on first use to keep cold starts short
+if TYPE_CHECKING:
+    import aiohttp
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Number of books returned per search page
+SEARCH_RESULTS_LIMIT = 10
+# Maximum number of book detail pages fetched at once while resolving download links
+DOWNLOAD_LINK_CONCURRENCY = int(os.environ.get("DOWNLOAD_LINK_CONCURRENCY", "5"))
+# Seconds to wait for a single book's download link before keeping the fallback
+DOWNLOAD_LINK_TIMEOUT = float(os.environ.get("DOWNLOAD_LINK_TIMEOUT", "10"))
+# Maximum number of books resolved by one /api/resolve-links request
+RESOLVE_LINKS_MAX_BATCH = int(os.environ.get("RESOLVE_LINKS_MAX_BATCH", "50"))
+# Load the scraping dependencies in the background at startup instead of on the first search
+WARM_UP = os.environ.get("WARM_UP", "0") == "1"
+# Server processes started by `python main.py`; uvicorn's own WEB_CONCURRENCY is honoured too
+WORKERS = int(os.environ.get("WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
+PORT = int(os.environ.get("PORT", "8000"))
+
+# Workers are separate processes, so they can only share cached searches through SQLite
+search_cache = SearchCache(CACHE_BACKEND or ("sqlite" if WORKERS > 1 else "memory"))
+link_cache = LinkCache()
+book_index = BookIndex()
+cover_cache = CoverCache()
+cover_flights = SingleFlight()
+prefetcher = Prefetcher()
+# Retrying is pointless while the upstream circuit breaker is open
+initial_page_retry = RetryPolicy("initial_download_page", attempt_timeout=20, give_up_on=(UpstreamUnavailable,))
+final_url_retry = RetryPolicy("final_download_url", attempt_timeout=30, give_up_on=(UpstreamUnavailable,))
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to handle a request, up to the response headers",
+                            ("method", "route", "status"))
+FALLBACKS = Counter("download_link_fallbacks_total", "Times a fallback link was returned instead of a resolved one",
+                    ("kind",))
+Gauge("search_cache_entries", "Search pages currently cached", lambda: search_cache.stats()["entries"])
+Gauge("active_requests", "Requests currently being handled", lambda: prefetcher.active_requests)
+
+_warm_up_task = None
+
+async def warm_up():
+    """Import bs4 and aiohttp, open the upstream connection pool and load the static assets."""
+    await asyncio.to_thread(load_parser)
+    await asyncio.to_thread(static_assets.build)
+    get_http_session()
+
+@app.on_event("startup")
+async def startup():
+    global _warm_up_task
+    await link_cache.purge_expired()
+    if WARM_UP:
+        # In the background, so the first request doesn't wait for it
+        _warm_up_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+    search_cache.close()
+    link_cache.close()
+    book_index.close()
+    cover_cache.close()
+    shutdown_parser_pool()
+    stop_logging()
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -25,39 +104,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.middleware("http")
+async def track_active_requests(request, call_next):
+    # Prefetching backs off while the worker is busy serving real requests
+    prefetcher.request_started()
+    try:
+        return await call_next(request)
+    finally:
+        prefetcher.request_finished()
+
+@app.middleware("http")
+async def observe_request(request, call_next):
+    """Tag the request with an ID for logs and record its duration and per-stage timings."""
+    request_id = new_request_id(request.headers.get("x-request-id"))
+    request_id_var.set(request_id)
+    timings = start_request_timing()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        # Label by route template rather than raw path to keep the number of series bounded
+        REQUEST_SECONDS.observe(elapsed, method=request.method, route=route.path if route else "other", status=status)
+    response.headers["X-Request-ID"] = request_id
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+# Pages and the assets they use, served precompressed from memory
+static_assets = AssetStore()
+static_assets.add("/", "index.html", page=True)
+static_assets.add("/results.html", "results.html", page=True)
+static_assets.add("/download.html", "download.html", page=True)
+static_assets.add("/static/results.html", "static/results.html", page=True)
+static_assets.add("/static/styles.css", "static/styles.css")
+static_assets.add("/static/results.js", "static/results.js")
+static_assets.add("/static/script.js", "static/script.js")
+static_assets.add("/static/HomePage2.jpg", "static/HomePage2.jpg")
+static_assets.add("/css/styles.css", "styles.css")
+static_assets.add("/js/script.js", "script.js")
+
+# Any other file under static/ is still served from disk
+app.mount("/static", AssetFiles(static_assets, directory="static"), name="static")
+# Only the root stylesheet and script, rather than the whole project directory
+app.mount("/css", AssetFiles(static_assets), name="css")
+app.mount("/js", AssetFiles(static_assets), name="js")
 
-# Also mount root CSS and JS files as static
-app.mount("/css", StaticFiles(directory="."), name="css")
-app.mount("/js", StaticFiles(directory="."), name="js")
+def serve_page(url: str, request: Request):
+    response = static_assets.response(url, request.headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return response
 
 # Serve index.html at root
 @app.get("/")
-async def read_root():
-    try:
-        return FileResponse("index.html")
-    except FileNotFoundError:
-        print("index.html not found in the current directory")
-        raise HTTPException(status_code=404, detail="File not found")
+async def read_root(request: Request):
+    return serve_page("/", request)
 
 # Serve results.html
 @app.get("/results.html")
-async def read_results():
-    try:
-        return FileResponse("results.html")
-    except FileNotFoundError:
-        print("results.html not found in the current directory")
-        raise HTTPException(status_code=404, detail="File not found")
+async def read_results(request: Request):
+    return serve_page("/results.html", request)
 
 # Serve download.html
 @app.get("/download.html")
-async def read_download():
-    try:
-        return FileResponse("download.html")
-    except FileNotFoundError:
-        print("download.html not found in the current directory")
-        raise HTTPException(status_code=404, detail="File not found")
+async def read_download(request: Request):
+    return serve_page("/download.html", request)
 
 class DownloadRequest(BaseModel):
     url: str
@@ -68,10 +183,8 @@ def generate_fake_download_url(book_url):
     book_id = ""
     try:
         # Try to extract the book ID from the URL
-        match = re.search(r'\/([^\/]+)-d(\d+)\.html$', book_url)
-        if match:
-            book_id = match.group(2)
-        else:
+        book_id = extract_book_id(book_url)
+        if not book_id:
             # Generate a random ID if we can't extract it
             book_id = ''.join(random.choices(string.digits, k=9))
     except:
@@ -81,458 +194,464 @@ def generate_fake_download_url(book_url):
     fake_hash = ''.join(random.choices('0123456789abcdef', k=32))
     
     # Return a properly formatted PDFDrive download URL
-    return f"https://www.pdfdrive.com/download.pdf?id={book_id}&h={fake_hash}&u=cache&ext=pdf"
+    return f"{PDFDRIVE_BASE_URL}/download.pdf?id={book_id}&h={fake_hash}&u=cache&ext=pdf"
 
-@app.post("/api/get-download-link")
-async def get_download_link(request: DownloadRequest):
-    print(f"Received download link request for URL: {request.url}")
+def is_upstream_url(url: str) -> bool:
+    """Whether `url` is on the upstream site, so it is safe to share through the link cache."""
+    parts = urlsplit(url)
+    return parts.scheme in ("http", "https") and parts.netloc.lower() == urlsplit(PDFDRIVE_BASE_URL).netloc.lower()
+
+def is_book_page_url(url: str) -> bool:
+    """Whether `url` is a book page on the upstream site, the only pages link resolution fetches."""
+    return is_upstream_url(url) and bool(extract_book_id(url))
+
+def to_direct_download_url(download_url: str) -> str:
+    """Swap a download.pdf link for the download.php format, which doesn't need the hash."""
+    if "download.pdf" in download_url:
+        id_match = DOWNLOAD_ID_PATTERN.search(download_url)
+        if id_match:
+            return f"{PDFDRIVE_BASE_URL}/download.php?id={id_match.group(1)}"
+    return download_url
+
+async def resolve_download_url(book_url: str) -> dict:
+    """Resolve a book page URL to its direct download link, falling back to the best link available.
+    `resolved` is False for fallbacks, which may only be due to a transient upstream failure."""
+    logger.info("Download link requested", extra={"book_url": book_url})
+    if not is_book_page_url(book_url):
+        # Only upstream book pages are fetched, or cached by their book ID
+        FALLBACKS.inc(kind="book_page")
+        return {"download_url": book_url, "resolved": False}
     
     try:
+        book_id = extract_book_id(book_url)
+        if book_id:
+            cached_url = await link_cache.get(book_id, DOWNLOAD_CHAIN)
+            if cached_url:
+                return {"download_url": to_direct_download_url(cached_url), "resolved": True}
+            if cached_url == "":
+                # Resolution failed recently, skip straight to the direct download link
+                FALLBACKS.inc(kind="cached_failure")
+                return {"download_url": f"{PDFDRIVE_BASE_URL}/download.php?id={book_id}", "resolved": False}
+        
+        # Both hops share one deadline so the request finishes within the function time limit
+        deadline = Deadline(DOWNLOAD_LINK_DEADLINE)
+        
         # Try to get the download page URL first
-        download_page_url = await get_initial_download_page(request.url)
+        download_page_url = await get_initial_download_page(book_url, deadline)
         if not download_page_url:
-            print("Could not find initial download page URL")
+            logger.warning("Could not find initial download page URL", extra={"book_url": book_url})
             # Instead of generating fake URL, which gives "file not exist" error
             # Use a direct document download approach
-            book_id_match = re.search(r'-d(\d+)\.html$', request.url)
-            if book_id_match:
-                book_id = book_id_match.group(1)
+            book_id = extract_book_id(book_url)
+            if book_id:
                 # Try PDF download format with direct access
-                return {"download_url": f"https://www.pdfdrive.com/download.php?id={book_id}"}
+                FALLBACKS.inc(kind="direct_download")
+                return {"download_url": f"{PDFDRIVE_BASE_URL}/download.php?id={book_id}", "resolved": False}
             else:
                 # Use the original URL as a fallback for viewing
-                return {"download_url": request.url}
+                FALLBACKS.inc(kind="book_page")
+                return {"download_url": book_url, "resolved": False}
         
         # Now get the actual download link from the download page
-        final_download_url = await get_final_download_url(download_page_url)
+        final_download_url = await get_final_download_url(download_page_url, deadline)
+        # Upstream failures aren't cached as a failed resolution, so the next request tries again
+        if book_id and final_download_url is not None and (not final_download_url or is_upstream_url(final_download_url)):
+            await link_cache.set(book_id, final_download_url, DOWNLOAD_CHAIN)
         if final_download_url:
-            print(f"Found final download URL: {final_download_url}")
+            logger.debug("Found final download URL: %s", final_download_url)
             # If URL contains "download.pdf", try the alternative download.php format
-            if "download.pdf" in final_download_url:
-                id_match = re.search(r'id=(\d+)', final_download_url)
-                if id_match:
-                    book_id = id_match.group(1)
-                    return {"download_url": f"https://www.pdfdrive.com/download.php?id={book_id}"}
-            return {"download_url": final_download_url}
+            return {"download_url": to_direct_download_url(final_download_url), "resolved": True}
         
         # If we couldn't get the final URL, return a direct download link if possible
-        book_id_match = re.search(r'id=(\d+)', download_page_url)
+        book_id_match = DOWNLOAD_ID_PATTERN.search(download_page_url)
         if book_id_match:
             book_id = book_id_match.group(1)
-            return {"download_url": f"https://www.pdfdrive.com/download.php?id={book_id}"}
+            FALLBACKS.inc(kind="direct_download")
+            return {"download_url": f"{PDFDRIVE_BASE_URL}/download.php?id={book_id}", "resolved": False}
         
-        print(f"Using download page URL: {download_page_url}")
-        return {"download_url": download_page_url}
+        logger.info("Using download page URL: %s", download_page_url)
+        FALLBACKS.inc(kind="download_page")
+        return {"download_url": download_page_url, "resolved": False}
     except Exception as e:
-        print(f"Error in get_download_link endpoint: {str(e)}")
+        logger.error("Error resolving download link: %s", e)
         # Try to extract book ID for direct download as a last resort
-        try:
-            book_id_match = re.search(r'-d(\d+)\.html$', request.url)
-            if book_id_match:
-                book_id = book_id_match.group(1)
-                return {"download_url": f"https://www.pdfdrive.com/download.php?id={book_id}"}
-        except:
-            pass
+        book_id = extract_book_id(book_url)
+        if book_id:
+            FALLBACKS.inc(kind="direct_download")
+            return {"download_url": f"{PDFDRIVE_BASE_URL}/download.php?id={book_id}", "resolved": False}
         # If all else fails, return the original URL for viewing
-        return {"download_url": request.url}
+        FALLBACKS.inc(kind="book_page")
+        return {"download_url": book_url, "resolved": False}
 
-async def get_initial_download_page(book_url: str) -> str:
+@app.get("/api/get-download-link")
+async def get_download_link_cacheable(url: str, request: Request):
+    """Same as the POST form, but cacheable by browsers and CDNs."""
+    payload = await resolve_download_url(url)
+    # Fallbacks aren't cached, so the link is resolved again once upstream recovers
+    return json_response(request, payload, API_CACHE_CONTROL if payload["resolved"] else NO_STORE)
+
+@app.post("/api/get-download-link")
+async def get_download_link_endpoint(download_request: DownloadRequest, request: Request):
+    return json_response(request, await resolve_download_url(download_request.url))
+
+# Retries rotate through these user agents to avoid blocking
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36'
+]
+
+def retry_headers(attempt: int, referer: str) -> dict:
+    return {
+        'User-Agent': USER_AGENTS[attempt % len(USER_AGENTS)],
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Connection': 'keep-alive',
+        'Referer': referer,
+        'Cache-Control': 'no-cache',
+        'Pragma': 'no-cache'
+    }
+
+@single_flight("initial_download_page", lambda book_url, deadline=None: book_url)
+async def get_initial_download_page(book_url: str, deadline: Optional[Deadline] = None) -> str:
     """Get the URL of the download waiting page."""
-    for attempt in range(3):  # Try up to 3 times with different headers
-        try:
-            print(f"Attempt {attempt+1} to fetch initial download page")
-            
-            # Create session with different user agents for each attempt
-            user_agents = [
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Safari/605.1.15',
-                'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36'
-            ]
+    async def attempt_fetch(attempt: int, timeout: float) -> str:
+        logger.debug("Attempt %d to fetch book page: %s", attempt + 1, book_url)
+        session = get_http_session()
+        headers = retry_headers(attempt, f"{PDFDRIVE_BASE_URL}/")
+        async with guarded_get(session, book_url, headers=headers, timeout=client_timeout(timeout)) as response:
+            if response.status != 200:
+                logger.warning("Failed to fetch book page. Status: %s", response.status)
+                return ""
             
-            headers = {
-                'User-Agent': user_agents[attempt % len(user_agents)],
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Connection': 'keep-alive',
-                'Referer': 'https://www.pdfdrive.com/',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache'
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=20)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                print(f"Fetching book page: {book_url}")
-                async with session.get(book_url, headers=headers) as response:
-                    if response.status != 200:
-                        print(f"Failed to fetch book page. Status: {response.status}")
-                        continue
-                    
-                    html = await response.text()
-                    print(f"Successfully fetched book page content, length: {len(html)}")
-                
-                # Parse the HTML content
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Look for the download button on the book page
-                download_buttons = []
-                
-                # Try multiple selectors to find download button
-                selectors = [
-                    'a#download-button', 
-                    'a#download-button-link', 
-                    'a.btn-success', 
-                    'a[href*="download"]',
-                    'a.btn-primary'
-                ]
-                
-                for selector in selectors:
-                    buttons = soup.select(selector)
-                    if buttons:
-                        download_buttons.extend(buttons)
-                
-                for button in download_buttons:
-                    href = button.get('href')
-                    if href and href.startswith('/'):
-                        return f"https://www.pdfdrive.com{href}"
-                    elif href and href.startswith('http'):
-                        return href
-                
-                # Try to extract from scripts
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    script_text = script.string if script.string else ''
-                    if script_text:
-                        # Look for URLs in the script
-                        url_matches = re.findall(r'["\']([^"\']*?download[^"\']*?)["\']', script_text)
-                        for url in url_matches:
-                            if '/download' in url:
-                                if url.startswith('/'):
-                                    return f"https://www.pdfdrive.com{url}"
-                                elif url.startswith('http'):
-                                    return url
+            html = await response.text()
+            logger.debug("Fetched book page content, length: %d", len(html))
         
-        except Exception as e:
-            print(f"Error in attempt {attempt+1} to get initial download page: {str(e)}")
+        download_page_url, _ = await download_page_extractor.extract(html, book_url)
+        return download_page_url
+    
+    download_page_url = await initial_page_retry.run(attempt_fetch, deadline)
+    if download_page_url:
+        return download_page_url
     
     # If all attempts failed, extract ID from URL and create a simulated download link
-    try:
-        match = re.search(r'-d(\d+)\.html$', book_url)
-        if match:
-            book_id = match.group(1)
-            return f"https://www.pdfdrive.com/download.php?id={book_id}"
-    except Exception as e:
-        print(f"Error creating fallback URL: {str(e)}")
+    book_id = extract_book_id(book_url)
+    if book_id:
+        FALLBACKS.inc(kind="initial_page_direct_download")
+        return f"{PDFDRIVE_BASE_URL}/download.php?id={book_id}"
     
     return ""
 
-async def get_final_download_url(download_page_url: str) -> str:
-    """Get the final PDF download URL from the download waiting page."""
-    for attempt in range(3):
-        try:
-            print(f"Attempt {attempt+1} to fetch final download URL from: {download_page_url}")
-            
-            user_agents = [
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Safari/605.1.15',
-                'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36'
-            ]
-            
-            headers = {
-                'User-Agent': user_agents[attempt % len(user_agents)],
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Connection': 'keep-alive',
-                'Referer': download_page_url,
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache'
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                # First get the download page
-                async with session.get(download_page_url, headers=headers) as response:
-                    if response.status != 200:
-                        print(f"Failed to fetch download page. Status: {response.status}")
-                        continue
-                    
-                    html = await response.text()
-                    print(f"Successfully fetched download page content, length: {len(html)}")
-                
-                # Look for the direct PDF download link pattern
-                pdf_download_match = re.search(r'https://www\.pdfdrive\.com/download\.pdf\?id=(\d+)&h=([a-f0-9]+)(&u=cache&ext=pdf)', html)
-                if pdf_download_match:
-                    return pdf_download_match.group(0)
-                
-                # Look for alternative pattern
-                alternative_match = re.search(r'https://www\.pdfdrive\.com/download\.pdf\?id=(\d+)&h=([a-f0-9]+)', html)
-                if alternative_match:
-                    direct_pdf_url = alternative_match.group(0)
-                    if "&u=cache&ext=pdf" not in direct_pdf_url:
-                        direct_pdf_url += "&u=cache&ext=pdf"
-                    return direct_pdf_url
-                
-                # Parse the HTML content
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Look for download links in the page
-                selectors = ['a.btn-success', 'a.btn-primary', 'a[href*="download.pdf"]']
-                for selector in selectors:
-                    buttons = soup.select(selector)
-                    for button in buttons:
-                        href = button.get('href')
-                        if href:
-                            if href.startswith('/'):
-                                full_url = f"https://www.pdfdrive.com{href}"
-                            else:
-                                full_url = href
-                                
-                            # Make sure it's in the correct format
-                            if "download.pdf?id=" in full_url and "&u=cache&ext=pdf" not in full_url:
-                                full_url += "&u=cache&ext=pdf"
-                                
-                            return full_url
-                
-                # Extract from meta refresh tag if present
-                meta_refresh = soup.find('meta', attrs={'http-equiv': 'refresh'})
-                if meta_refresh:
-                    content = meta_refresh.get('content', '')
-                    url_match = re.search(r'url=([^;]+)', content)
-                    if url_match:
-                        redirect_url = url_match.group(1)
-                        if redirect_url.startswith('/'):
-                            redirect_url = f"https://www.pdfdrive.com{redirect_url}"
-                        return redirect_url
-                
-                # Check if there are any scripts with timers that redirect
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    script_text = script.string if script.string else ''
-                    if script_text and ('setTimeout' in script_text or 'window.location' in script_text):
-                        # Look for URL in the redirection script
-                        url_match = re.search(r'location(?:\.href)?\s*=\s*[\'"]([^\'"]*)[\'"]', script_text)
-                        if url_match:
-                            redirect_url = url_match.group(1)
-                            if redirect_url.startswith('/'):
-                                redirect_url = f"https://www.pdfdrive.com{redirect_url}"
-                            return redirect_url
-                
-                # Extract from embedded data
-                book_id_match = re.search(r'(?:id|bookId)[\s]*:[\s]*[\'"]?(\d+)[\'"]?', html)
-                hash_match = re.search(r'(?:hash|h)[\s]*:[\s]*[\'"]?([a-f0-9]+)[\'"]?', html)
-                
-                if book_id_match and hash_match:
-                    book_id = book_id_match.group(1)
-                    hash_val = hash_match.group(1)
-                    return f"https://www.pdfdrive.com/download.pdf?id={book_id}&h={hash_val}&u=cache&ext=pdf"
-                
-        except Exception as e:
-            print(f"Error in attempt {attempt+1} to get final download URL: {str(e)}")
+@single_flight("final_download_url", lambda download_page_url, deadline=None: download_page_url)
+async def get_final_download_url(download_page_url: str, deadline: Optional[Deadline] = None) -> Optional[str]:
+    """Get the final PDF download URL from the download waiting page.
+
+    Returns "" when the page was fetched but had no link, and None when it couldn't be
+    fetched in time (errors, timeouts, an open circuit breaker), which isn't worth caching.
+    """
+    found_no_link = False
     
-    # If we can't find the final download URL, extract what we can from the download page URL
-    try:
-        # Try to get book ID from download page URL
-        id_match = re.search(r'id=(\d+)', download_page_url)
-        if id_match:
-            book_id = id_match.group(1)
-            fake_hash = ''.join(random.choices('0123456789abcdef', k=32))
-            return f"https://www.pdfdrive.com/download.pdf?id={book_id}&h={fake_hash}&u=cache&ext=pdf"
-    except Exception as e:
-        print(f"Error creating fallback URL from download page: {str(e)}")
+    async def attempt_fetch(attempt: int, timeout: float) -> str:
+        nonlocal found_no_link
+        found_no_link = False
+        logger.debug("Attempt %d to fetch final download URL from: %s", attempt + 1, download_page_url)
+        session = get_http_session()
+        headers = retry_headers(attempt, download_page_url)
+        # First get the download page
+        async with guarded_get(session, download_page_url, headers=headers, timeout=client_timeout(timeout)) as response:
+            if response.status != 200:
+                logger.warning("Failed to fetch download page. Status: %s", response.status)
+                return ""
+            
+            html = await read_text(response, stop_pattern=PDF_DOWNLOAD_PARTIAL_PATTERN)
+            logger.debug("Fetched download page content, length: %d", len(html))
+        
+        final_download_url, _ = await final_url_extractor.extract(html, download_page_url)
+        found_no_link = not final_download_url
+        return final_download_url
     
-    return ""
+    # Without a real download URL the caller falls back to a direct download link
+    final_download_url = await final_url_retry.run(attempt_fetch, deadline)
+    if final_download_url or found_no_link:
+        return final_download_url
+    return None
 
 class Book:
-    def __init__(self, title: str, image_url: str, link: str, download_link: str = None):
+    def __init__(self, title: str, image_url: str, link: str, download_link: str = None, book_id: str = ""):
         self.title = title
         self.image_url = image_url
         self.link = link
         self.download_link = download_link
+        self.book_id = book_id
+        # True once download_link is a real link rather than the listing fallback
+        self.link_resolved = False
+
+@single_flight("download_link", lambda session, book_url: book_url)
+async def get_download_link(session: "aiohttp.ClientSession", book_url: str) -> Optional[str]:
+    """Extract the download link from a book page: "" when the page has none, None when the
+    page couldn't be fetched. Transport errors and an open circuit breaker are raised."""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Connection': 'keep-alive',
+        'Referer': f"{PDFDRIVE_BASE_URL}/",
+    }
+    
+    async with guarded_get(session, book_url, headers=headers, timeout=20) as response:
+        if response.status != 200:
+            logger.warning("Failed to fetch book page. Status: %s", response.status)
+            return None
+        html = await read_text(response, stop_pattern=PDF_DOWNLOAD_PARTIAL_PATTERN)
+    
+    # An empty link means none was found, and callers fall back to an ID-based link
+    download_link, _ = await book_page_extractor.extract(html, book_url)
+    return download_link
+
+async def resolve_real_download_link(session: "aiohttp.ClientSession", book_url: str, semaphore: asyncio.Semaphore) -> str:
+    """Get a book's real download link from the link cache or its page, or "" if it can't be resolved in time."""
+    book_id = extract_book_id(book_url) if is_book_page_url(book_url) else ""
+    if book_id:
+        cached_link = await link_cache.get(book_id, BOOK_PAGE)
+        if cached_link is not None:
+            # An empty cached link means resolution failed recently
+            return cached_link
+    
+    async with semaphore:
+        try:
+            real_download_link = await asyncio.wait_for(
+                get_download_link(session, book_url),
+                timeout=DOWNLOAD_LINK_TIMEOUT
+            )
+            # Only a page without a link is cached as a failure; upstream errors aren't
+            if book_id and real_download_link is not None and (not real_download_link or is_upstream_url(real_download_link)):
+                await link_cache.set(book_id, real_download_link, BOOK_PAGE)
+            return real_download_link or ""
+        except asyncio.TimeoutError:
+            logger.warning("Timed out getting real download link for: %s", book_url)
+        except Exception as e:
+            logger.warning("Error getting real download link: %s", e)
+    return ""
+
+async def resolve_book_download_link(session: "aiohttp.ClientSession", book: Book, semaphore: asyncio.Semaphore):
+    """Replace a book's fallback download link with the real one, within the per-book timeout."""
+    real_download_link = await resolve_real_download_link(session, book.link, semaphore)
+    if real_download_link:
+        book.download_link = real_download_link
+        book.link_resolved = True
+    else:
+        FALLBACKS.inc(kind="listing_link")
+
+async def resolve_download_links(session: "aiohttp.ClientSession", books: List[Book]):
+    """Resolve download links for all books concurrently with a bounded fan-out."""
+    if not books:
+        return
+    semaphore = asyncio.Semaphore(DOWNLOAD_LINK_CONCURRENCY)
+    await asyncio.gather(*(resolve_book_download_link(session, book, semaphore) for book in books))
 
-async def get_download_link(session: aiohttp.ClientSession, book_url: str) -> str:
+def build_search_url(query: str, page: int = 1) -> str:
+    base_url = f"{PDFDRIVE_BASE_URL}/search"
+    return f"{base_url}?q={query}&page={page}"
+
+async def scrape_books(query: str, page: int = 1, resolve_links: bool = True) -> List[Book]:
+    """Scrape a search page, resolving the returned books' real download links unless `resolve_links` is False."""
+    books, total_books = await scrape_listing(query, page)
+    if resolve_links:
+        await resolve_download_links(get_http_session(), books)
+    await index_books(query, page, books, total_books)
+    return books, total_books
+
+async def index_books(query: str, page: int, books: List[Book], total: int):
+    """Add a scraped search page to the local book index."""
+    indexed = [
+        {**book_to_dict(book), "image_url": book.image_url, "download_link": book.download_link if book.link_resolved else ""}
+        for book in books if book.book_id
+    ]
+    await book_index.ingest(normalize_search_key(query, page)[0], page, total, indexed)
+
+@single_flight("search", build_search_url)
+async def scrape_listing(query: str, page: int = 1) -> List[Book]:
+    """Scrape a search page's listing, with fallback download links only."""
+    url = build_search_url(query, page)
+    
+    timeout = client_timeout(30)
+    session = get_http_session()
     try:
+        # Use different user agents to avoid blocking
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
             'Connection': 'keep-alive',
-            'Referer': 'https://www.pdfdrive.com/',
+            'Referer': 'https://www.google.com/',
         }
         
-        async with session.get(book_url, headers=headers, timeout=20) as response:
+        async with guarded_get(session, url, headers=headers, timeout=timeout) as response:
             html = await response.text()
-            
-            # First look for direct download URLs in the page - improved regex
-            pdf_download_match = re.search(r'https://www\.pdfdrive\.com/download\.pdf\?id=(\d+)&h=([a-f0-9]+)(&u=cache&ext=pdf)', html)
-            if pdf_download_match:
-                return pdf_download_match.group(0)
-            
-            # Try alternative pattern and fix the URL if needed
-            alternative_match = re.search(r'https://www\.pdfdrive\.com/download\.pdf\?id=(\d+)&h=([a-f0-9]+)', html)
-            if alternative_match:
-                direct_pdf_url = alternative_match.group(0)
-                if "&u=cache&ext=pdf" not in direct_pdf_url:
-                    direct_pdf_url += "&u=cache&ext=pdf"
-                return direct_pdf_url
-            
-            # Next look for download buttons
-            soup = BeautifulSoup(html, 'html.parser')
-            download_button = soup.find('a', id='download-button-link')
-            if download_button and download_button.get('href'):
-                href = download_button.get('href')
-                if href.startswith('/'):
-                    full_url = f"https://www.pdfdrive.com{href}"
-                else:
-                    full_url = href
-                
-                # Ensure correct format
-                if "download.pdf?id=" in full_url and "&u=cache&ext=pdf" not in full_url:
-                    full_url += "&u=cache&ext=pdf"
+        
+        soup = await parse_html_async(html, SEARCH_PAGE_ONLY)
+        
+        books = []
+        book_elements = soup.find_all('div', class_='file-left')
+        
+        for element in book_elements:
+            try:
+                link_element = element.find('a')
+                img_element = element.find('img')
                 
-                return full_url
-            
-            # Look for other buttons that might be download buttons
-            buttons = soup.select('a.btn-success, a[href*="download"]')
-            for button in buttons:
-                href = button.get('href')
-                if href and ('download.pdf' in href or 'getfile.php' in href):
-                    if href.startswith('/'):
-                        full_url = f"https://www.pdfdrive.com{href}"
-                    else:
-                        full_url = href
-                    
-                    # Ensure correct format
-                    if "download.pdf?id=" in full_url and "&u=cache&ext=pdf" not in full_url:
-                        full_url += "&u=cache&ext=pdf"
+                if link_element and img_element:
+                    title = img_element.get('title', '')
+                    image_url = img_element.get('src', '')
+                    link = link_element.get('href', '')
                     
-                    return full_url
-            
-            # Try to extract book ID from the URL and script data
-            book_id_match = re.search(r'-d(\d+)\.html$', book_url)
-            if book_id_match:
-                book_id = book_id_match.group(1)
+                    if title and image_url and link:
+                        full_link = f"{PDFDRIVE_BASE_URL}{link}"
+                        
+                        # Extract the book ID for building a download link
+                        book_id = extract_book_id(full_link)
+                        download_link = ""
+                        
+                        if book_id:
+                            # Create a PDF download link - we'll fetch a better one on the details page
+                            # This is a fallback in case get_download_link fails
+                            fake_hash = ''.join(random.choices('0123456789abcdef', k=32))
+                            download_link = f"{PDFDRIVE_BASE_URL}/download.pdf?id={book_id}&h={fake_hash}&u=cache&ext=pdf"
+                        
+                        books.append(Book(
+                            title=title,
+                            image_url=image_url,
+                            link=full_link,
+                            download_link=download_link,
+                            book_id=book_id
+                        ))
+            except Exception as e:
+                logger.warning("Error processing book element: %s", e)
+                continue
+        
                 
-                # Look for hash in scripts
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    script_text = script.string if script.string else ''
-                    if script_text:
-                        hash_match = re.search(r'hash[\s]*:[\s]*[\'"]?([a-f0-9]+)[\'"]?', script_text)
-                        if hash_match:
-                            hash_val = hash_match.group(1)
-                            return f"https://www.pdfdrive.com/download.pdf?id={book_id}&h={hash_val}&u=cache&ext=pdf"
-            
-            # If no download link found, attempt to build one from book_id
-            if book_id_match:
-                book_id = book_id_match.group(1)
-                fake_hash = ''.join(random.choices('0123456789abcdef', k=32))
-                return f"https://www.pdfdrive.com/download.pdf?id={book_id}&h={fake_hash}&u=cache&ext=pdf"
+        # Get total number of books from pagination info
+        pagination = soup.find('div', class_='pagination')
+        total_books = 0
+        if pagination:
+            try:
+                total_text = pagination.find('span', class_='total').text
+                total_books = int(total_text.split()[0])
+            except Exception as e:
+                logger.warning("Error getting pagination: %s", e)
+                total_books = len(books) * page  # Estimate total if not found
                 
+        return books[:SEARCH_RESULTS_LIMIT], total_books  # Return books and total count
     except Exception as e:
-        print(f"Error getting download link: {e}")
-    
-    # If all fails, return empty string
-    return ''
+        logger.error("Error scraping books: %s", e)
+        return [], 0
+
+def cover_url(book_id: str, image_url: str) -> str:
+    """Point covers at the cover proxy. The upstream image is passed along as `src` for
+    instances whose book index doesn't have the book, e.g. another serverless instance."""
+    if COVER_PROXY and book_index.enabled and book_id:
+        if is_cover_source(image_url):
+            return f"/api/cover/{book_id}?src={quote(image_url, safe='')}"
+        return f"/api/cover/{book_id}"
+    return image_url
+
+def is_cover_source(image_url: str) -> bool:
+    """Whether the cover proxy may fetch `image_url`, so it can't be used to fetch arbitrary hosts."""
+    parts = urlsplit(image_url)
+    allowed = [urlsplit(PDFDRIVE_BASE_URL).netloc.lower(), *COVER_SOURCE_HOSTS]
+    return parts.scheme in ("http", "https") and parts.netloc.lower() in allowed
+
+def book_to_dict(book: Book) -> dict:
+    return {
+        "title": book.title,
+        "image_url": cover_url(book.book_id, book.image_url),
+        "link": book.link,
+        "download_link": book.download_link,
+        "book_id": book.book_id
+    }
+
+def build_search_payload(books: List[Book], total: int, page: int) -> dict:
+    return {
+        "books": [book_to_dict(book) for book in books],
+        "total": total,
+        "page": page
+    }
+
+async def fetch_search_payload(query: str, page: int, resolve_links: bool = True) -> Optional[dict]:
+    """Scrape a search page, returning None when there is nothing worth caching."""
+    books, total = await scrape_books(query, page, resolve_links)
+    if not books:
+        # scrape_books swallows upstream errors, so don't cache empty results
+        return None
+    return build_search_payload(books, total, page)
 
-async def scrape_books(query: str, page: int = 1) -> List[Book]:
-    base_url = "https://www.pdfdrive.com/search"
-    url = f"{base_url}?q={query}&page={page}"
+async def prefetch_next_page(query: str, page: int, payload: dict):
+    """Warm the search cache with the next page, which is usually requested next."""
+    # Checked first so a disabled prefetcher costs no cache lookup
+    if not prefetcher.enabled or len(payload["books"]) < SEARCH_RESULTS_LIMIT:
+        return
+    next_key = normalize_search_key(query, page + 1)
+    if await search_cache.is_fresh(next_key):
+        return
     
-    timeout = aiohttp.ClientTimeout(total=30)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            # Use different user agents to avoid blocking
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Connection': 'keep-alive',
-                'Referer': 'https://www.google.com/',
-            }
-            
-            async with session.get(url, headers=headers) as response:
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                books = []
-                book_elements = soup.find_all('div', class_='file-left')
-                
-                for element in book_elements:
-                    try:
-                        link_element = element.find('a')
-                        img_element = element.find('img')
-                        
-                        if link_element and img_element:
-                            title = img_element.get('title', '')
-                            image_url = img_element.get('src', '')
-                            link = link_element.get('href', '')
-                            
-                            if title and image_url and link:
-                                full_link = f"https://www.pdfdrive.com{link}"
-                                
-                                # Extract the book ID for building a download link
-                                book_id_match = re.search(r'-d(\d+)\.html$', full_link)
-                                download_link = ""
-                                
-                                if book_id_match:
-                                    book_id = book_id_match.group(1)
-                                    # Create a PDF download link - we'll fetch a better one on the details page
-                                    # This is a fallback in case get_download_link fails
-                                    fake_hash = ''.join(random.choices('0123456789abcdef', k=32))
-                                    download_link = f"https://www.pdfdrive.com/download.pdf?id={book_id}&h={fake_hash}&u=cache&ext=pdf"
-                                
-                                # Try to get the actual download link from the book page
-                                try:
-                                    real_download_link = await get_download_link(session, full_link)
-                                    if real_download_link:
-                                        download_link = real_download_link
-                                except Exception as e:
-                                    print(f"Error getting real download link: {e}")
-                                
-                                books.append(Book(
-                                    title=title,
-                                    image_url=image_url,
-                                    link=full_link,
-                                    download_link=download_link
-                                ))
-                    except Exception as e:
-                        print(f"Error processing book element: {e}")
-                        continue
-                        
-                # Get total number of books from pagination info
-                pagination = soup.find('div', class_='pagination')
-                total_books = 0
-                if pagination:
-                    try:
-                        total_text = pagination.find('span', class_='total').text
-                        total_books = int(total_text.split()[0])
-                    except Exception as e:
-                        print(f"Error getting pagination: {e}")
-                        total_books = len(books) * page  # Estimate total if not found
-                        
-                return books[:10], total_books  # Return books and total count
-        except Exception as e:
-            print(f"Error scraping books: {e}")
-            return [], 0
+    async def load() -> bool:
+        next_payload = await fetch_search_payload(query, page + 1)
+        if next_payload is None:
+            return False
+        await search_cache.set(next_key, next_payload)
+        return True
+    
+    prefetcher.schedule(next_key, load)
 
-@app.get("/api/search")
-async def search_books(query: str, page: int = 1):
+async def search_book_index(query: str, page: int) -> Optional[dict]:
+    """Answer a search page from the local book index, refreshing it in the background when stale."""
+    key = normalize_search_key(query, page)
+    indexed = await book_index.search(key[0], page, SEARCH_RESULTS_LIMIT)
+    if indexed is None:
+        return None
+    books, total, is_stale = indexed
+    if is_stale and not await search_cache.is_fresh(key):
+        # Scraping the page re-indexes it and warms the search cache as well
+        search_cache.refresh(key, lambda: fetch_search_payload(query, page))
+    for book in books:
+        book["image_url"] = cover_url(book["book_id"], book["image_url"])
+        if not book["download_link"]:
+            # Same direct download fallback as /api/get-download-link
+            book["download_link"] = f"{PDFDRIVE_BASE_URL}/download.php?id={book['book_id']}"
+    return {"books": books, "total": total, "page": page}
+
+async def find_books(query: str, page: int, no_cache: bool, lazy: bool, from_index: bool) -> dict:
+    resolve_links = not lazy
     try:
-        books, total = await scrape_books(query, page)
-        return {
-            "books": [
-                {
-                    "title": book.title,
-                    "image_url": book.image_url,
-                    "link": book.link,
-                    "download_link": book.download_link
-                }
-                for book in books
-            ],
-            "total": total,
-            "page": page
-        }
+        if no_cache:
+            books, total = await scrape_books(query, page, resolve_links)
+            return build_search_payload(books, total, page)
+        
+        if from_index:
+            payload = await search_book_index(query, page)
+            if payload is not None:
+                return payload
+        
+        key = normalize_search_key(query, page)
+        lazy_key = (*key, "lazy")
+        # A fully resolved result also answers a lazy search
+        for cache_key in ([key] if resolve_links else [key, lazy_key]):
+            cached = await search_cache.get(cache_key)
+            if cached:
+                payload, is_stale = cached
+                if is_stale:
+                    search_cache.refresh(cache_key, lambda: fetch_search_payload(query, page, cache_key == key))
+                prefetcher.record_hit(cache_key)
+                await prefetch_next_page(query, page, payload)
+                return payload
+        
+        payload = await fetch_search_payload(query, page, resolve_links)
+        if payload is None:
+            return build_search_payload([], 0, page)
+        await search_cache.set(key if resolve_links else lazy_key, payload)
+        await prefetch_next_page(query, page, payload)
+        return payload
     except Exception as e:
-        print(f"API Error: {e}")
+        logger.error("API Error: %s", e)
         # Return empty results instead of raising an exception
         return {
             "books": [],
@@ -541,7 +660,231 @@ async def search_books(query: str, page: int = 1):
             "error": str(e)
         }
 
+@app.get("/api/search")
+async def search_books(request: Request, query: str, page: int = 1, no_cache: bool = False, lazy: bool = False,
+                       from_index: bool = False):
+    """Search for books. With `lazy`, download links aren't resolved; use /api/resolve-links for them.
+    With `from_index`, pages the local book index can answer are served from it without going upstream."""
+    payload = await find_books(query, page, no_cache, lazy, from_index)
+    # Empty and failed results may just be an upstream hiccup, so only real listings are cached
+    cacheable = not no_cache and payload["books"] and "error" not in payload
+    return json_response(request, payload, API_CACHE_CONTROL if cacheable else NO_STORE)
+
+@app.get("/api/search/stream")
+async def search_books_stream(query: str, page: int = 1, no_cache: bool = False):
+    """Search for books, streaming NDJSON: one "book" record per book as soon as its
+    download link is resolved, then a final "summary" record with the total."""
+    def record(data: dict) -> str:
+        return json.dumps(data) + "\n"
+    
+    async def stream():
+        try:
+            key = normalize_search_key(query, page)
+            cached = None if no_cache else await search_cache.get(key)
+            if cached:
+                payload, is_stale = cached
+                if is_stale:
+                    search_cache.refresh(key, lambda: fetch_search_payload(query, page))
+                prefetcher.record_hit(key)
+                for book in payload["books"]:
+                    yield record({"type": "book", **book})
+                yield record({"type": "summary", "total": payload["total"], "page": page})
+                await prefetch_next_page(query, page, payload)
+                return
+            
+            books, total = await scrape_listing(query, page)
+            # Index the listing before streaming it so the cover proxy can find the books
+            await index_books(query, page, books, total)
+            session = get_http_session()
+            semaphore = asyncio.Semaphore(DOWNLOAD_LINK_CONCURRENCY)
+            
+            async def resolve(book: Book) -> Book:
+                await resolve_book_download_link(session, book, semaphore)
+                return book
+            
+            tasks = [asyncio.ensure_future(resolve(book)) for book in books]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    book = await task
+                    yield record({"type": "book", **book_to_dict(book)})
+            finally:
+                # Stop resolving if the client goes away
+                for task in tasks:
+                    task.cancel()
+            
+            if books and not no_cache:
+                payload = build_search_payload(books, total, page)
+                await search_cache.set(key, payload)
+                await prefetch_next_page(query, page, payload)
+            await index_books(query, page, books, total)
+            yield record({"type": "summary", "total": total, "page": page})
+        except Exception as e:
+            logger.error("API Error: %s", e)
+            yield record({"type": "summary", "total": 0, "page": page, "error": str(e)})
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+class ResolveLinksRequest(BaseModel):
+    urls: List[str] = []
+    book_ids: List[str] = []
+
+async def resolve_link_record(session: "aiohttp.ClientSession", book_url: str, book_id: str, semaphore: asyncio.Semaphore) -> dict:
+    if book_url:
+        download_link = await resolve_real_download_link(session, book_url, semaphore)
+    else:
+        # Without the book page URL there is nothing to fetch, so only the link cache can help
+        download_link = await link_cache.get(book_id) or ""
+    resolved = bool(download_link)
+    if not resolved and book_id:
+        # Same direct download fallback as /api/get-download-link
+        FALLBACKS.inc(kind="direct_download")
+        download_link = f"{PDFDRIVE_BASE_URL}/download.php?id={book_id}"
+    return {
+        "link": book_url,
+        "book_id": book_id,
+        "download_link": download_link,
+        "resolved": resolved
+    }
+
+@app.post("/api/resolve-links")
+async def resolve_links(request: ResolveLinksRequest):
+    """Resolve download links for many books concurrently, streaming one NDJSON record per book as it completes.
+    URLs that aren't upstream book pages are skipped, so this can't be used to fetch arbitrary hosts."""
+    targets = [(url, extract_book_id(url)) for url in request.urls if is_book_page_url(url)]
+    targets += [("", book_id) for book_id in request.book_ids if book_id.isdigit()]
+    targets = targets[:RESOLVE_LINKS_MAX_BATCH]
+    
+    async def stream():
+        session = get_http_session()
+        semaphore = asyncio.Semaphore(DOWNLOAD_LINK_CONCURRENCY)
+        tasks = [asyncio.ensure_future(resolve_link_record(session, url, book_id, semaphore)) for url, book_id in targets]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
+        finally:
+            # Stop resolving if the client goes away
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def fetch_cover(image_url: str) -> Optional[tuple]:
+    """Download a cover image, returning (content type, bytes) or None."""
+    try:
+        session = get_http_session()
+        async with guarded_get(session, image_url, timeout=client_timeout(15)) as response:
+            content_type = response.headers.get("Content-Type", "")
+            if response.status != 200 or not content_type.startswith("image/"):
+                logger.warning("Cover fetch failed. Status: %s, type: %s", response.status, content_type)
+                return None
+            if (response.content_length or 0) > COVER_MAX_BYTES:
+                logger.warning("Cover too large: %s", image_url)
+                return None
+            # content.read(n) only returns what is buffered, so read to EOF chunk by chunk
+            chunks = []
+            size = 0
+            async for chunk in response.content.iter_chunked(16384):
+                size += len(chunk)
+                if size > COVER_MAX_BYTES:
+                    logger.warning("Cover too large: %s", image_url)
+                    return None
+                chunks.append(chunk)
+            return content_type, b"".join(chunks)
+    except Exception as e:
+        logger.warning("Error fetching cover %s: %s", image_url, e)
+        return None
+
+async def load_cover(book_id: str, image_url: str, persist: bool = True) -> Optional[tuple]:
+    fetched = await fetch_cover(image_url)
+    if fetched is None:
+        return None
+    content_type, content = fetched
+    if not persist:
+        return cover_digest(content), content_type, content
+    digest = await cover_cache.set(book_id, content_type, content)
+    return digest, content_type, content
+
+@app.get("/api/cover/{book_id}")
+async def get_cover(book_id: str, request: Request, src: str = ""):
+    """Serve a book's cover from the disk cache, fetching it from upstream once on first use.
+    Books missing from the book index are fetched from `src`, if it is on an allowed host.
+    Nothing ties `src` to the book, so those covers aren't cached under the book's ID."""
+    if not book_id.isdigit():
+        raise HTTPException(status_code=404, detail="Unknown book")
+    cover = await cover_cache.get(book_id)
+    if cover is None:
+        image_url = await book_index.image_url(book_id)
+        persist = bool(image_url)
+        if not image_url and is_cover_source(src):
+            image_url = src
+        if not image_url:
+            raise HTTPException(status_code=404, detail="Unknown book")
+        # Concurrent first requests for the same cover share one upstream fetch
+        cover = await cover_flights.do(("cover", book_id, image_url), lambda: load_cover(book_id, image_url, persist))
+        if cover is None:
+            # Let the browser try the upstream image itself
+            return RedirectResponse(image_url, status_code=307)
+    
+    digest, content_type, content = cover
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={COVER_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type=content_type, headers=headers)
+
+@app.get("/metrics")
+async def metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/health")
+async def health():
+    """Report upstream circuit breaker state; "degraded" means requests are served from fallbacks."""
+    upstream = upstream_health()
+    healthy = all(host["breaker"] == "closed" for host in upstream.values())
+    return {"status": "ok" if healthy else "degraded", "upstream": upstream}
+
+@app.get("/api/warm-up")
+async def warm_up_endpoint():
+    """Load everything a search needs, e.g. from a scheduled ping, so the next search doesn't wait for it."""
+    started = time.perf_counter()
+    await warm_up()
+    return {"warm": True, "seconds": round(time.perf_counter() - started, 3)}
+
+@app.get("/api/pool-stats")
+async def pool_stats():
+    return get_pool_stats()
+
+@app.get("/api/single-flight-stats")
+async def single_flight_stats():
+    return upstream_flights.stats()
+
+@app.get("/api/retry-stats")
+async def retry_stats():
+    return {
+        "initial_download_page": initial_page_retry.stats(),
+        "final_download_url": final_url_retry.stats()
+    }
+
+@app.get("/api/extraction-stats")
+async def get_extraction_stats():
+    return extraction_stats()
+
+@app.get("/api/cache-stats")
+async def cache_stats():
+    return {
+        "search": search_cache.stats(),
+        "download_links": link_cache.stats(),
+        "book_index": book_index.stats(),
+        "covers": cover_cache.stats(),
+        "prefetch": prefetcher.stats()
+    }
+
 # For local development
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    if WORKERS > 1:
+        # Each worker process imports the app itself, so it is passed by name
+        uvicorn.run("main:app", host="0.0.0.0", port=PORT, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT) 
\ No newline at end of file
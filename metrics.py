@@ -0,0 +1,149 @@
+import os
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+
+# Seconds; covers everything from a cache read to a slow upstream page
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Stage name -> seconds spent in it while handling the current request
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram:
+    """Bucketed observations, e.g. durations.
+
+    With `stage` set, each observation is also added to the current request's
+    Server-Timing entry for that stage.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS, stage: Optional[str] = None):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.stage = stage
+        # label values -> [bucket counts..., sum, count]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[index] += 1
+        entry[-2] += value
+        entry[-1] += 1
+        if self.stage:
+            add_stage_time(self.stage, value)
+
+    def samples(self):
+        for key, entry in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, entry):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {entry[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {entry[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {entry[-1]}"
+
+
+class Gauge:
+    """A current value read from `read()` at scrape time: a number, or a dict of label tuples to numbers."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, read: Callable[[], object], labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.read = read
+        _registry.append(self)
+
+    def samples(self):
+        value = self.read()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key, sample in value.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {float(sample)}"
+
+
+
+# Shared by every cache: search results, download links, the book index and covers
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and outcome (hit, stale, negative, miss)",
+                        ("cache", "outcome"))
+
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def start_request_timing() -> Dict[str, float]:
+    """Start collecting stage durations for the current request."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def add_stage_time(stage: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    # Stages can overlap when work runs concurrently, so they may add up to more than the total
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Optional
+
+from metrics import Histogram
+
+# bs4 takes a while to import, so it is only loaded once a page is parsed
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+# "lxml" is used when installed since it is several times faster than the pure-Python parser
+PARSER_BACKEND = os.environ.get("PARSER_BACKEND", "lxml" if HAS_LXML else "html.parser")
+# Threads used to parse pages off the event loop; 0 parses inline
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "4"))
+
+# Search pages only need the book listings and the pagination block
+SEARCH_PAGE_ONLY = "search"
+# Download link extraction only looks at links, scripts and meta refresh tags
+DETAIL_PAGE_ONLY = "detail"
+
+PARSE_SECONDS = Histogram("parse_seconds", "Time spent parsing an upstream page", ("page",), stage="parse")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_strainers: Dict[str, "SoupStrainer"] = {}
+
+
+def _strainer(parse_only: Optional[str]) -> Optional["SoupStrainer"]:
+    if parse_only is None:
+        return None
+    if not _strainers:
+        from bs4 import SoupStrainer
+        _strainers[SEARCH_PAGE_ONLY] = SoupStrainer('div', class_=['file-left', 'pagination'])
+        _strainers[DETAIL_PAGE_ONLY] = SoupStrainer(['a', 'script', 'meta'])
+    return _strainers[parse_only]
+
+
+def parse_html(html: str, parse_only: Optional[str] = None) -> "BeautifulSoup":
+    """Parse a page with the configured backend, keeping only the SEARCH_PAGE_ONLY or DETAIL_PAGE_ONLY part if given."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, PARSER_BACKEND, parse_only=_strainer(parse_only))
+
+
+def load_parser():
+    """Import bs4 and the parser backend ahead of the first page, e.g. from a warm-up hook."""
+    parse_html("<p></p>", DETAIL_PAGE_ONLY)
+
+
+def _timed_parse(html: str, parse_only: Optional[str]):
+    started = time.perf_counter()
+    soup = parse_html(html, parse_only)
+    return soup, time.perf_counter() - started
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="html-parse")
+    return _executor
+
+
+async def parse_html_async(html: str, parse_only: Optional[str] = None) -> "BeautifulSoup":
+    """Parse a page in the worker pool so the event loop keeps serving other requests."""
+    if PARSE_WORKERS <= 0:
+        soup, seconds = _timed_parse(html, parse_only)
+    else:
+        loop = asyncio.get_running_loop()
+        soup, seconds = await loop.run_in_executor(_get_executor(), _timed_parse, html, parse_only)
+    # Timed inside the worker so queueing for a free thread isn't counted as parsing
+    PARSE_SECONDS.observe(seconds, page=parse_only or "full")
+    return soup
+
+
+def shutdown_parser_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from singleflight import bypass_single_flight
+
+logger = logging.getLogger(__name__)
+
+# Scrape page N+1 in the background after serving page N
+PREFETCH_NEXT_PAGE = os.environ.get("PREFETCH_NEXT_PAGE", "0") == "1"
+# Prefetches running at once across the whole worker
+PREFETCH_MAX_IN_FLIGHT = int(os.environ.get("PREFETCH_MAX_IN_FLIGHT", "2"))
+# Prefetches started per minute across the whole worker
+PREFETCH_PER_MINUTE = int(os.environ.get("PREFETCH_PER_MINUTE", "30"))
+# Active requests at which prefetching is skipped and running prefetches are cancelled
+PREFETCH_BUSY_THRESHOLD = int(os.environ.get("PREFETCH_BUSY_THRESHOLD", "8"))
+# Seconds a prefetched page has to be requested before it counts as wasted
+PREFETCH_HIT_WINDOW = float(os.environ.get("PREFETCH_HIT_WINDOW", "600"))
+
+
+class Prefetcher:
+    """Runs low-priority background loads within a global budget and tracks whether they pay off."""
+
+    def __init__(self, enabled: bool = PREFETCH_NEXT_PAGE, max_in_flight: int = PREFETCH_MAX_IN_FLIGHT,
+                 per_minute: int = PREFETCH_PER_MINUTE, busy_threshold: int = PREFETCH_BUSY_THRESHOLD,
+                 hit_window: float = PREFETCH_HIT_WINDOW):
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self.per_minute = per_minute
+        self.busy_threshold = busy_threshold
+        self.hit_window = hit_window
+        self.active_requests = 0
+        self._tasks = {}
+        self._started_at = deque()
+        # key -> time the prefetched result was stored, until it is used or wasted
+        self._prefetched = {}
+        self.scheduled = 0
+        self.completed = 0
+        self.hits = 0
+        self.wasted = 0
+        self.cancelled = 0
+        self.skipped_busy = 0
+        self.skipped_budget = 0
+
+    def request_started(self):
+        self.active_requests += 1
+        if self.active_requests >= self.busy_threshold:
+            self.cancel_all()
+
+    def request_finished(self):
+        self.active_requests -= 1
+
+    def schedule(self, key, load: Callable[[], Awaitable[bool]]):
+        """Run `load` in the background unless busy or over budget.
+
+        `load` returns True when it stored a result that a later request can hit.
+        Its upstream fetches bypass single-flight coalescing, so cancelling it
+        stops them rather than leaving shielded shared fetches running.
+        """
+        self._expire()
+        if not self.enabled or key in self._tasks or key in self._prefetched:
+            return
+        if self.active_requests >= self.busy_threshold:
+            self.skipped_busy += 1
+            return
+
+        now = time.monotonic()
+        while self._started_at and now - self._started_at[0] > 60:
+            self._started_at.popleft()
+        if len(self._tasks) >= self.max_in_flight or len(self._started_at) >= self.per_minute:
+            self.skipped_budget += 1
+            return
+        self._started_at.append(now)
+        self.scheduled += 1
+
+        async def run():
+            # Only affects this task and the tasks it starts
+            bypass_single_flight.set(True)
+            try:
+                # Let the request that triggered the prefetch finish first
+                await asyncio.sleep(0)
+                if await load():
+                    self.completed += 1
+                    self._prefetched[key] = time.monotonic()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+            except Exception as e:
+                logger.warning("Error prefetching %s: %s", key, e)
+            finally:
+                self._tasks.pop(key, None)
+
+        self._tasks[key] = asyncio.ensure_future(run())
+
+    def record_hit(self, key):
+        """Count a request served from a prefetched result."""
+        self._expire()
+        if self._prefetched.pop(key, None) is not None:
+            self.hits += 1
+
+    def cancel_all(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    def _expire(self):
+        # Entries are added in time order, so only the oldest ones need checking
+        now = time.monotonic()
+        while self._prefetched:
+            key, stored_at = next(iter(self._prefetched.items()))
+            if now - stored_at <= self.hit_window:
+                break
+            del self._prefetched[key]
+            self.wasted += 1
+
+    def stats(self) -> dict:
+        self._expire()
+        used = self.hits + self.wasted
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._tasks),
+            "pending": len(self._prefetched),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "hits": self.hits,
+            "wasted": self.wasted,
+            "cancelled": self.cancelled,
+            "skipped_busy": self.skipped_busy,
+            "skipped_budget": self.skipped_budget,
+            "hit_ratio": self.hits / used if used else None,
+            "waste_ratio": self.wasted / used if used else None,
+        }
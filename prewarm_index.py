@@ -0,0 +1,58 @@
+"""Pre-warm the local book index by scraping search pages for a list of queries.
+
+    python prewarm_index.py queries.txt --pages 2 --concurrency 4
+
+Queries are read one per line ("-" reads stdin); blank lines and lines
+starting with # are skipped. Download links are resolved too unless --lazy
+is given, so indexed books come with real links.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import main
+
+
+def read_queries(path: str) -> list:
+    lines = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with lines:
+        return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+async def prewarm(queries: list, pages: int, concurrency: int, resolve_links: bool) -> int:
+    await main.app.router.startup()
+    semaphore = asyncio.Semaphore(concurrency)
+    indexed = 0
+
+    async def scrape(query: str, page: int):
+        nonlocal indexed
+        async with semaphore:
+            books, _ = await main.scrape_books(query, page, resolve_links)
+            indexed += len(books)
+            print(f"{query!r} page {page}: {len(books)} books")
+
+    try:
+        await asyncio.gather(*(scrape(query, page) for query in queries for page in range(1, pages + 1)))
+    finally:
+        await main.app.router.shutdown()
+    return indexed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("queries", help="file with one query per line, or - for stdin")
+    parser.add_argument("--pages", type=int, default=1, help="search pages scraped per query")
+    parser.add_argument("--concurrency", type=int, default=4, help="search pages scraped at once")
+    parser.add_argument("--lazy", action="store_true", help="don't resolve download links")
+    args = parser.parse_args()
+
+    queries = read_queries(args.queries)
+    started = time.perf_counter()
+    indexed = asyncio.run(prewarm(queries, args.pages, args.concurrency, not args.lazy))
+    print(f"Indexed {indexed} books from {len(queries)} queries in {time.perf_counter() - started:.1f}s "
+          f"into {main.book_index.path}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# End-to-end seconds for resolving one download link, kept under Vercel's 60s maxDuration
+DOWNLOAD_LINK_DEADLINE = float(os.environ.get("DOWNLOAD_LINK_DEADLINE", "50"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.25"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "2"))
+# An attempt isn't started with less than this many seconds left before the deadline
+RETRY_MIN_ATTEMPT_TIME = float(os.environ.get("RETRY_MIN_ATTEMPT_TIME", "2"))
+# Send a second request when the first is slower than this percentile of recent attempts
+RETRY_HEDGE = os.environ.get("RETRY_HEDGE", "0") == "1"
+RETRY_HEDGE_PERCENTILE = float(os.environ.get("RETRY_HEDGE_PERCENTILE", "0.9"))
+# Successful attempts observed before hedging starts
+RETRY_HEDGE_MIN_SAMPLES = 20
+
+RETRY_ATTEMPTS = Counter("retry_attempts_total", "Attempts made by each retry policy, by result (success, failed, timeout, error)",
+                         ("policy", "result"))
+RETRY_OUTCOMES = Counter("retry_outcomes_total", "Retry policy runs by outcome (success, exhausted, deadline_exhausted, given_up)",
+                         ("policy", "outcome"))
+RETRY_HEDGES = Counter("retry_hedges_total", "Hedged attempts sent, and those that won", ("policy", "result"))
+
+
+class Deadline:
+    """A point in time by which a whole operation, across all its hops, has to finish."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+class RetryPolicy:
+    """Retries an upstream attempt with jittered exponential backoff within a deadline.
+
+    `attempt_fn(attempt, timeout)` returns a truthy result on success; a falsy
+    result or an exception counts as a failed attempt. When the deadline can't
+    cover another attempt, or an attempt raises one of `give_up_on`, `run`
+    gives up and returns "".
+    """
+
+    def __init__(self, name: str, max_attempts: int = 3, attempt_timeout: float = 20,
+                 base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY,
+                 min_attempt_time: float = RETRY_MIN_ATTEMPT_TIME, hedge: bool = RETRY_HEDGE,
+                 hedge_percentile: float = RETRY_HEDGE_PERCENTILE, give_up_on: tuple = ()):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt_time = min_attempt_time
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.give_up_on = give_up_on
+        self._latencies = deque(maxlen=200)
+        self.attempts = 0
+        self.successes = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exhausted = 0
+        self.given_up = 0
+
+    async def run(self, attempt_fn: Callable[[int, float], Awaitable[Optional[str]]],
+                  deadline: Optional[Deadline] = None) -> str:
+        if deadline is None:
+            deadline = Deadline(self.attempt_timeout * self.max_attempts)
+
+        attempt = 0
+        while attempt < self.max_attempts:
+            if attempt > 0:
+                # Full jitter keeps retries from many requests from lining up
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if deadline.remaining() - delay < self.min_attempt_time:
+                    break
+                await asyncio.sleep(delay)
+
+            remaining = deadline.remaining()
+            if remaining < self.min_attempt_time:
+                break
+            timeout = min(self.attempt_timeout, remaining)
+
+            try:
+                result, used = await self._attempt(attempt_fn, attempt, timeout)
+            except self.give_up_on as e:
+                logger.info("Giving up on %s: %s", self.name, e)
+                self.given_up += 1
+                RETRY_OUTCOMES.inc(policy=self.name, outcome="given_up")
+                return ""
+            if result:
+                self.successes += 1
+                RETRY_OUTCOMES.inc(policy=self.name, outcome="success")
+                return result
+            attempt += used
+
+        if attempt < self.max_attempts:
+            self.deadline_exhausted += 1
+            RETRY_OUTCOMES.inc(policy=self.name, outcome="deadline_exhausted")
+        else:
+            RETRY_OUTCOMES.inc(policy=self.name, outcome="exhausted")
+        return ""
+
+    async def _timed_attempt(self, attempt_fn, attempt: int, timeout: float) -> str:
+        self.attempts += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(attempt_fn(attempt, timeout), timeout)
+        except asyncio.TimeoutError:
+            logger.info("%s attempt %d timed out after %.1fs", self.name, attempt + 1, timeout)
+            RETRY_ATTEMPTS.inc(policy=self.name, result="timeout")
+            return ""
+        except self.give_up_on:
+            raise
+        except Exception as e:
+            logger.warning("Error in %s attempt %d: %s", self.name, attempt + 1, e)
+            RETRY_ATTEMPTS.inc(policy=self.name, result="error")
+            return ""
+        if result:
+            self._latencies.append(time.monotonic() - started)
+        RETRY_ATTEMPTS.inc(policy=self.name, result="success" if result else "failed")
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self._latencies) < RETRY_HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile))]
+
+    async def _attempt(self, attempt_fn, attempt: int, timeout: float):
+        """Run one attempt, hedged with the next one if it is slow. Returns (result, attempts used)."""
+        primary = asyncio.ensure_future(self._timed_attempt(attempt_fn, attempt, timeout))
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None or hedge_delay >= timeout or attempt + 1 >= self.max_attempts:
+            return await primary, 1
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result(), 1
+
+        self.hedges += 1
+        RETRY_HEDGES.inc(policy=self.name, result="sent")
+        hedged = asyncio.ensure_future(self._timed_attempt(attempt_fn, attempt + 1, timeout - hedge_delay))
+        pending = {primary, hedged}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        if task is hedged:
+                            self.hedge_wins += 1
+                            RETRY_HEDGES.inc(policy=self.name, result="won")
+                        return task.result(), 2
+        finally:
+            for task in pending:
+                task.cancel()
+        return "", 2
+
+    def stats(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": self._hedge_delay(),
+            "deadline_exhausted": self.deadline_exhausted,
+            "given_up": self.given_up,
+        }
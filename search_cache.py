@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+from cache_backends import create_cache_backend
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached search result is served as fresh
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "600"))
+# Extra seconds an expired result is still served while it is refreshed in the background
+SEARCH_CACHE_STALE_TTL = float(os.environ.get("SEARCH_CACHE_STALE_TTL", "3600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# "memory" keeps results in this process, "sqlite" shares them between worker processes through
+# SEARCH_CACHE_PATH. Left empty, the app picks "sqlite" when it runs more than one worker
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "")
+SEARCH_CACHE_PATH = os.environ.get("SEARCH_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ebook_search_cache.db"))
+
+
+def normalize_search_key(query: str, page: int) -> Tuple[str, int]:
+    """Build the cache key for a search so trivially different queries share an entry."""
+    return re.sub(r'\s+', ' ', query).strip().lower(), page
+
+
+class SearchCache:
+    """LRU cache of search payloads with TTL and stale-while-revalidate, kept in a cache backend."""
+
+    def __init__(self, backend: str = "memory", ttl: float = SEARCH_CACHE_TTL, stale_ttl: float = SEARCH_CACHE_STALE_TTL,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES, max_bytes: int = SEARCH_CACHE_MAX_BYTES,
+                 path: str = SEARCH_CACHE_PATH):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Entries are dropped once they are too old to be served even while stale
+        self.backend = create_cache_backend(backend, path, max_entries, max_bytes)
+        self._refreshing = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def _backend_key(key) -> str:
+        return json.dumps(key)
+
+    async def get(self, key) -> Optional[Tuple[dict, bool]]:
+        """Return (value, is_stale) for a usable entry, or None on a miss."""
+        entry = await self.backend.get(self._backend_key(key))
+        if entry is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="search", outcome="miss")
+            return None
+
+        stored_at, value = entry
+        if time.time() - stored_at > self.ttl:
+            self.stale_hits += 1
+            CACHE_LOOKUPS.inc(cache="search", outcome="stale")
+            return value, True
+        self.hits += 1
+        CACHE_LOOKUPS.inc(cache="search", outcome="hit")
+        return value, False
+
+    async def is_fresh(self, key) -> bool:
+        """Check for a fresh entry without touching the LRU order or counters."""
+        entry = await self.backend.get(self._backend_key(key), touch=False)
+        return entry is not None and time.time() - entry[0] <= self.ttl
+
+    async def set(self, key, value: dict):
+        await self.backend.set(self._backend_key(key), value, self.ttl + self.stale_ttl)
+
+    def refresh(self, key, loader: Callable[[], Awaitable[Optional[dict]]]):
+        """Refresh an entry in the background, at most once at a time per key in this process."""
+        if key in self._refreshing:
+            return
+
+        async def run():
+            try:
+                value = await loader()
+                if value is not None:
+                    await self.set(key, value)
+                    self.refreshes += 1
+            except Exception as e:
+                logger.warning("Error refreshing search cache entry %s: %s", key, e)
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.ensure_future(run())
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.backend.stats(),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refreshing": len(self._refreshing),
+        }
@@ -0,0 +1,83 @@
+import asyncio
+import functools
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from metrics import Counter
+
+SINGLE_FLIGHT_CALLS = Counter("single_flight_calls_total", "Upstream fetches by whether they ran or joined one in flight",
+                              ("result",))
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so equivalent requests share a key."""
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', query, ''))
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    Every caller awaits the shared task through a shield, so a caller that
+    times out or is cancelled doesn't cancel the work for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            SINGLE_FLIGHT_CALLS.inc(result="executed")
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.coalesced += 1
+            SINGLE_FLIGHT_CALLS.inc(result="coalesced")
+
+        if timeout is None:
+            return await asyncio.shield(task)
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _done(self, key, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so it isn't reported as unhandled when every caller gave up
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+upstream_flights = SingleFlight()
+
+# Set in background work such as prefetches, so its fetches run unshared and stop when it is cancelled
+# instead of continuing as shielded shared tasks
+bypass_single_flight: ContextVar[bool] = ContextVar("bypass_single_flight", default=False)
+
+
+def single_flight(name: str, url_arg: Callable[..., str]):
+    """Decorate an upstream fetch so concurrent calls for the same URL share one fetch and parse.
+
+    `url_arg` receives the decorated function's arguments and returns the URL it fetches.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if bypass_single_flight.get():
+                return await fn(*args, **kwargs)
+            key = (name, normalize_url(url_arg(*args, **kwargs)))
+            return await upstream_flights.do(key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -1,22 +1,81 @@
 let currentPage = 1;
 let currentQuery = '';
 let isLoading = false;
+let resolveController = null;
+
+// Stream search results into the grid as each book is resolved; when false, the
+// listing is shown straight away and download links are filled in afterwards
+const STREAM_SEARCH_RESULTS = true;
 
 // Function to create book card HTML
-function createBookCard(book) {
+function createBookCard(book, linkPending = false) {
+    const downloadLink = linkPending
+        ? '<a class="download-link pending" target="_blank">Finding download link...</a>'
+        : `<a class="download-link" href="${book.download_link}" target="_blank">Download</a>`;
     return `
-        <div class="book-card">
+        <div class="book-card" data-link="${book.link}">
             <img src="${book.image_url}" alt="${book.title}" loading="lazy">
             <h3>${book.title}</h3>
             <a href="${book.link}" target="_blank">View Book</a>
+            ${downloadLink}
         </div>
     `;
 }
 
+// Function to read a newline-delimited JSON response, calling onRecord as each record arrives
+async function readNdjson(response, onRecord) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onRecord(JSON.parse(line)));
+    }
+    if (buffer.trim()) onRecord(JSON.parse(buffer));
+}
+
+// Function to fill in a book card's download link once it is resolved
+function updateDownloadLink(record) {
+    const card = document.querySelector(`.book-card[data-link="${CSS.escape(record.link)}"]`);
+    if (!card) return;
+
+    const downloadLink = card.querySelector('.download-link');
+    downloadLink.href = record.download_link;
+    downloadLink.textContent = 'Download';
+    downloadLink.classList.remove('pending');
+}
+
+// Function to resolve download links in the background, updating cards as results stream in
+async function resolveDownloadLinks(books) {
+    // Stop resolving links for the previous page
+    if (resolveController) resolveController.abort();
+    resolveController = new AbortController();
+
+    try {
+        const response = await fetch('/api/resolve-links', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ urls: books.map(book => book.link) }),
+            signal: resolveController.signal
+        });
+
+        // Each line of the response is one resolved book
+        await readNdjson(response, updateDownloadLink);
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Error resolving download links:', error);
+        }
+    }
+}
+
 // Function to display books
 function displayBooks(books) {
     const booksGrid = document.querySelector('.books-grid');
-    booksGrid.innerHTML = books.map(book => createBookCard(book)).join('');
+    booksGrid.innerHTML = books.map(book => createBookCard(book, true)).join('');
 }
 
 // Function to update pagination
@@ -30,6 +89,24 @@ function updatePagination(total, currentPage) {
     currentPageSpan.textContent = `Page ${currentPage}`;
 }
 
+// Function to stream books from the API, appending each card as it arrives
+async function streamBooks(query, page) {
+    // Links for the previous page no longer need resolving
+    if (resolveController) resolveController.abort();
+
+    const booksGrid = document.querySelector('.books-grid');
+    booksGrid.innerHTML = '';
+
+    const response = await fetch(`/api/search/stream?query=${encodeURIComponent(query)}&page=${page}`);
+    await readNdjson(response, record => {
+        if (record.type === 'book') {
+            booksGrid.insertAdjacentHTML('beforeend', createBookCard(record));
+        } else if (record.type === 'summary') {
+            updatePagination(record.total, page);
+        }
+    });
+}
+
 // Function to fetch books from API
 async function fetchBooks(query, page = 1) {
     if (isLoading) return;
@@ -37,11 +114,16 @@ async function fetchBooks(query, page = 1) {
     isLoading = true;
     
     try {
-        const response = await fetch(`/api/search?query=${encodeURIComponent(query)}&page=${page}`);
-        const data = await response.json();
-        
-        displayBooks(data.books);
-        updatePagination(data.total, page);
+        if (STREAM_SEARCH_RESULTS) {
+            await streamBooks(query, page);
+        } else {
+            const response = await fetch(`/api/search?query=${encodeURIComponent(query)}&page=${page}&lazy=true`);
+            const data = await response.json();
+            
+            displayBooks(data.books);
+            updatePagination(data.total, page);
+            resolveDownloadLinks(data.books);
+        }
         
         currentPage = page;
         currentQuery = query;
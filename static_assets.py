@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+from http_caching import accepted_encodings, etag_matches
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds browsers may reuse assets requested by their plain, unfingerprinted URL
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", "300"))
+# Fingerprinted URLs change whenever the content does, so they can be cached for good
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# HTML pages are entry points with fixed URLs, so browsers always revalidate them
+PAGE_CACHE_CONTROL = "no-cache"
+
+# Text assets smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 512
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+class Asset:
+    def __init__(self, url: str, file_path: str, page: bool = False):
+        self.url = url
+        self.file_path = file_path
+        self.page = page
+        self.media_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        # Starlette adds the charset to text/* types itself
+        if self.media_type == "application/javascript":
+            self.media_type += "; charset=utf-8"
+        self.content = b""
+        self.fingerprint = ""
+        # Content-Encoding -> compressed bytes, only kept when smaller than the original
+        self.encodings: Dict[str, bytes] = {}
+
+    @property
+    def fingerprinted_url(self) -> str:
+        root, ext = os.path.splitext(self.url)
+        return f"{root}.{self.fingerprint}{ext}"
+
+    def load(self, content: bytes):
+        self.content = content
+        self.fingerprint = hashlib.sha256(content).hexdigest()[:12]
+        self.encodings = {}
+        if len(content) < COMPRESS_MIN_BYTES or not self.media_type.startswith(COMPRESSIBLE_TYPES):
+            return
+        candidates = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates["br"] = brotli.compress(content, quality=11)
+        for encoding, compressed in candidates.items():
+            if len(compressed) < len(content):
+                self.encodings[encoding] = compressed
+
+
+class AssetStore:
+    """Fingerprinted, precompressed copies of the site's pages and assets, kept in memory.
+
+    Pages are served at their own URLs; other assets at their plain URL and at
+    a fingerprinted one (`styles.<hash>.css`) that pages are rewritten to use.
+    Everything is loaded on first use.
+    """
+
+    def __init__(self):
+        self._assets: Dict[str, Asset] = {}
+        self._by_url: Dict[str, Asset] = {}
+        self._built = False
+
+    def add(self, url: str, file_path: str, page: bool = False):
+        self._assets[url] = Asset(url, file_path, page)
+        self._built = False
+
+    def build(self):
+        # Assets first, so pages can be rewritten to their fingerprinted URLs
+        assets = sorted(self._assets.values(), key=lambda asset: asset.page)
+        self._by_url = {}
+        for asset in assets:
+            try:
+                with open(asset.file_path, "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                logger.warning("%s not found, %s won't be served", asset.file_path, asset.url)
+                continue
+            if asset.page:
+                content = self._rewrite(content)
+            asset.load(content)
+            self._by_url[asset.url] = asset
+            if not asset.page:
+                self._by_url[asset.fingerprinted_url] = asset
+        self._built = True
+
+    def _rewrite(self, content: bytes) -> bytes:
+        text = content.decode("utf-8")
+        for url, asset in self._by_url.items():
+            # Pages have fixed URLs, so links to them (e.g. "/") are left alone
+            if asset.page or url != asset.url:
+                continue
+            for quote in ('"', "'"):
+                text = text.replace(f"{quote}{url}{quote}", f"{quote}{asset.fingerprinted_url}{quote}")
+        return text.encode("utf-8")
+
+    def get(self, url: str) -> Optional[Asset]:
+        if not self._built:
+            self.build()
+        return self._by_url.get(url)
+
+    def response(self, url: str, headers) -> Optional[Response]:
+        """Build the response for `url` given the request headers, or None for an unknown URL."""
+        asset = self.get(url)
+        if asset is None:
+            return None
+
+        accepted = accepted_encodings(headers.get("accept-encoding", ""))
+        # Prefer brotli, then gzip, whatever order the client lists them in
+        encoding = next((name for name in ("br", "gzip") if name in asset.encodings and name in accepted), None)
+        body = asset.encodings[encoding] if encoding else asset.content
+
+        if asset.page:
+            cache_control = PAGE_CACHE_CONTROL
+        elif url == asset.url:
+            cache_control = f"public, max-age={STATIC_MAX_AGE}"
+        else:
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        # Each encoding is a different representation, so it needs its own strong ETag
+        etag = f'"{asset.fingerprint}-{encoding}"' if encoding else f'"{asset.fingerprint}"'
+        response_headers = {"ETag": etag, "Cache-Control": cache_control}
+        if asset.encodings:
+            response_headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=response_headers)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.media_type, headers=response_headers)
+
+
+class AssetFiles:
+    """ASGI app for a mount: serves the store's assets, and other files from `directory` if given."""
+
+    def __init__(self, store: AssetStore, directory: Optional[str] = None):
+        self.store = store
+        self.fallback = StaticFiles(directory=directory) if directory else None
+
+    async def __call__(self, scope, receive, send):
+        # The mount's prefix plus the path below it, without any prefix the whole app is served under
+        mount_path = scope.get("root_path", "")[len(scope.get("app_root_path", "")):]
+        response = None
+        if scope["method"] in ("GET", "HEAD"):
+            response = self.store.response(mount_path + scope["path"], Headers(scope=scope))
+        if response is None:
+            if self.fallback is not None:
+                await self.fallback(scope, receive, send)
+                return
+            response = Response("Not Found", status_code=404, media_type="text/plain")
+        await response(scope, receive, send)
@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from metrics import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:
+    import aiohttp
+
+# Adaptive concurrency limits per upstream host
+UPSTREAM_INITIAL_CONCURRENCY = int(os.environ.get("UPSTREAM_INITIAL_CONCURRENCY", "10"))
+UPSTREAM_MIN_CONCURRENCY = int(os.environ.get("UPSTREAM_MIN_CONCURRENCY", "1"))
+UPSTREAM_MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "20"))
+# Requests slower than this many seconds count as congestion and shrink the limit
+UPSTREAM_LATENCY_TARGET = float(os.environ.get("UPSTREAM_LATENCY_TARGET", "5"))
+UPSTREAM_DECREASE_FACTOR = 0.7
+
+# Circuit breaker settings per upstream host
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+# Seconds the breaker stays open before letting a probe request through
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+
+UPSTREAM_REQUESTS = Counter("upstream_requests_total", "Upstream requests by outcome (success, failure, cancelled or rejected by the breaker)",
+                            ("host", "outcome"))
+UPSTREAM_BODY_SECONDS = Histogram("upstream_body_seconds", "Time from an upstream response's headers until its body was read",
+                                  ("host",), stage="upstream_body")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of making a request while a host's circuit breaker is open."""
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows by about one per limit's worth of good
+    responses and shrinks multiplicatively on errors or slow responses."""
+
+    def __init__(self, initial: int = UPSTREAM_INITIAL_CONCURRENCY, minimum: int = UPSTREAM_MIN_CONCURRENCY,
+                 maximum: int = UPSTREAM_MAX_CONCURRENCY, latency_target: float = UPSTREAM_LATENCY_TARGET):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # Woken but giving up, so pass the free slot on
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, success: bool, latency: float):
+        self.in_flight -= 1
+        if success and latency <= self.latency_target:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        else:
+            now = time.monotonic()
+            # Decrease at most once per second, so one burst of failures doesn't collapse the limit
+            if now - self._last_decrease >= 1:
+                self.limit = max(self.minimum, self.limit * UPSTREAM_DECREASE_FACTOR)
+                self._last_decrease = now
+        self._wake()
+
+    def cancel(self):
+        """Free the slot of a cancelled request without adjusting the limit."""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        # Wake as many waiters as there are free slots; each re-checks the limit
+        free_slots = int(self.limit) - self.in_flight
+        while self._waiters and free_slots > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+
+class CircuitBreaker:
+    """Opens when the recent failure rate is too high, then lets one probe
+    through after BREAKER_OPEN_SECONDS to decide whether to close again."""
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_request(self):
+        """Raise UpstreamUnavailable unless a request may be made now."""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                raise UpstreamUnavailable("Upstream circuit breaker is open")
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise UpstreamUnavailable("Upstream circuit breaker is half-open and already probing")
+            self._probing = True
+
+    def cancel_probe(self):
+        """Give back the half-open probe slot when no request was made."""
+        self._probing = False
+
+    def record(self, success: bool):
+        if self.state == HALF_OPEN:
+            self._probing = False
+            if success:
+                self.state = CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+
+
+class HostGuard:
+    def __init__(self):
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker()
+        self.successes = 0
+        self.failures = 0
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "rejected": self.breaker.rejected,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+_guards = {}
+
+Gauge("upstream_concurrency_limit", "Current adaptive concurrency limit per upstream host",
+      lambda: {(host,): guard.limiter.limit for host, guard in _guards.items()}, ("host",))
+Gauge("upstream_breaker_open", "1 while a host's circuit breaker is open or half-open",
+      lambda: {(host,): guard.breaker.state != CLOSED for host, guard in _guards.items()}, ("host",))
+
+
+def get_host_guard(url: str) -> HostGuard:
+    host = urlsplit(url).netloc.lower()
+    if host not in _guards:
+        _guards[host] = HostGuard()
+    return _guards[host]
+
+
+@asynccontextmanager
+async def guarded_get(session: "aiohttp.ClientSession", url: str, **kwargs):
+    """`session.get()` behind the host's circuit breaker and adaptive concurrency limit.
+
+    Exceptions, timeouts and 429/5xx responses count as failures. Requests the caller
+    cancels, such as a losing hedge or a dropped prefetch, say nothing about the host
+    and count as neither.
+    """
+    host = urlsplit(url).netloc.lower()
+    guard = get_host_guard(url)
+    try:
+        guard.breaker.before_request()
+    except UpstreamUnavailable:
+        UPSTREAM_REQUESTS.inc(host=host, outcome="rejected")
+        raise
+    try:
+        await guard.limiter.acquire()
+    except BaseException:
+        # The probe slot is only held while a request is actually made
+        guard.breaker.cancel_probe()
+        raise
+
+    started = time.monotonic()
+    success = False
+    try:
+        async with session.get(url, **kwargs) as response:
+            healthy_status = response.status < 500 and response.status != 429
+            headers_at = time.monotonic()
+            try:
+                yield response
+            finally:
+                UPSTREAM_BODY_SECONDS.observe(time.monotonic() - headers_at, host=host)
+        success = healthy_status
+    except asyncio.CancelledError:
+        UPSTREAM_REQUESTS.inc(host=host, outcome="cancelled")
+        guard.breaker.cancel_probe()
+        guard.limiter.cancel()
+        raise
+    except BaseException:
+        record_outcome(guard, host, False, time.monotonic() - started)
+        raise
+    record_outcome(guard, host, success, time.monotonic() - started)
+
+
+def record_outcome(guard: HostGuard, host: str, success: bool, latency: float):
+    if success:
+        guard.successes += 1
+    else:
+        guard.failures += 1
+    UPSTREAM_REQUESTS.inc(host=host, outcome="success" if success else "failure")
+    guard.breaker.record(success)
+    guard.limiter.release(success, latency)
+
+
+def upstream_health() -> dict:
+    return {host: guard.stats() for host, guard in _guards.items()}